@@ -31,14 +31,19 @@ GDRIVE_CLIENT_ID_FILE       = '.googleclientid'
 GDRIVE_CLIENT_SECRET_FILE   = '.googleclientsecret'
 
 class GoogleDriveClient(object):
-    def __init__(self,handler,verbose=False):
+    def __init__(self,handler,verbose=False,drive=None):
+        '''
+        drive: already authenticated GoogleDrive instance to use instead of setting one up
+        '''
         self.verbose = verbose
         self.handler = handler
-        gclientid,gsecret = self.handler.setupKeyAndToken(GDRIVE_CLIENT_ID_FILE,GDRIVE_CLIENT_SECRET_FILE,'google')
-        assert(len(gclientid) == 72)
-        assert(len(gsecret) == 24)
-        self.handler.createSettingsYaml(gclientid,gsecret)
-        self.drive = self.handler.getGoogleDriveInstance()
+        if drive is None:
+            gclientid,gsecret = self.handler.setupKeyAndToken(GDRIVE_CLIENT_ID_FILE,GDRIVE_CLIENT_SECRET_FILE,'google')
+            assert(len(gclientid) == 72)
+            assert(len(gsecret) == 24)
+            self.handler.createSettingsYaml(gclientid,gsecret)
+            drive = self.handler.getGoogleDriveInstance()
+        self.drive = drive
 
     def getFiles(self, folder_id='root', filters=''):
         '''
@@ -54,15 +59,20 @@ class GoogleDriveClient(object):
         files = self.getFiles(folder_id,filters)
         return [{'title':item.get('title'),'mime_type':item.get('mimeType'),'id':item.get('id')} for item in files]
 
-    def uploadFile(self, name, mimeType='',permType='user',permValue='user',permRole='owner'):
+    def uploadFile(self, name, mimeType='',permType='user',permValue='user',permRole='owner',folderId=None,title=None):
         '''
         name: name of a local file
         permType: user|group|domain|anyone
         permRole: owner|organizer|fileOrganizer|writer|reader|writable
+        folderId: uid for folder to upload into, defaults to root
+        title: title of the uploaded file, defaults to name
         returns: shareable link
         '''
         assert(os.path.exists(name))
-        file = self.drive.CreateFile({'title':name, 'mimeType':mimeType})
+        metadata = {'title':title or name, 'mimeType':mimeType}
+        if folderId and folderId != 'root':
+            metadata['parents'] = [{'id':folderId}]
+        file = self.drive.CreateFile(metadata)
         file.SetContentFile(name)
         file.Upload()
         permission = file.InsertPermission({
@@ -76,3 +76,18 @@ get_refresh_token: True
         # The following disables annoying warning ref. discovery_cache
         logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
         return self.drive
+
+    def loadSavedAuth(self):
+        '''
+        Loads and refreshes the credentials saved by getGoogleDriveInstance without
+        ever prompting, for unattended use.
+        Returns: authorized GoogleAuth
+        '''
+        gauth = GoogleAuth()
+        gauth.LoadCredentialsFile(self.cred_file)
+        if gauth.credentials is None:
+            raise RuntimeError("No saved Google Drive credentials in '{}'".format(self.cred_file))
+        if gauth.access_token_expired:
+            gauth.Refresh()
+        gauth.Authorize()
+        return gauth
@@ -48,10 +48,13 @@ class SlackClient(object):
 			responses.append(response.text)
 		return responses
 
-	def post_image(self, filename, channels):
+	def post_image(self, filename, channels, name=None):
+		'''
+		name: file name shown in Slack, defaults to filename
+		'''
 		assert(self.token)
 		responses = []
-		f = {'file': (filename, open(filename, 'rb'), 'image/png', {'Expires':'0'})}
+		f = {'file': (name or filename, open(filename, 'rb'), 'image/png', {'Expires':'0'})}
 		for channel in channels:
 			response = requests.post(url='https://slack.com/api/files.upload', data=
 				{'token': self.token, 'channels': channel, 'media': f}, 
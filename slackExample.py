@@ -1,6 +1,6 @@
-import subprocess
-import os, requests
+import os, getpass, requests
 import arrow
+from trelloReporter import TrelloReporter
 
 def getToken(tokenFile,credType):
 	if os.path.exists(tokenFile):
@@ -27,30 +27,24 @@ def post_image(filename, token, channels):
 		headers={'Accept': 'application/json'}, files=f)
 	return response.text
 
-def createStaticVisualisation(date,board,force=False,toSlack=False,channel=''):
-	try:
-		o = "Example_{}.png".format(date)
-		if force:
-			c = 'python trelloMetrics.py static'
-			cl = '{} -r --b="{}" --c="g,y,pink,r,r,r,r,r" --o="{}" --force'.format(c,board,o)
-		else:
-			cl = '{} -r --b="{}" --c="g,y,pink,r,r,r,r,r" --o="{}"'.format(c,board,o)
-		r = subprocess.check_output(cl, shell=True,stderr=subprocess.STDOUT)
-		blurb = "Distribution of cards in {} {}".format(board,date)
-		if toSlack:
-			print(post_text(text=blurb, token=token, channel =channel))
-			print(post_image(filename=o, token=token, channels =channel))
-		else:
-			print("Not pushing {} to Slack".format(o))
-	except subprocess.CalledProcessError as e:
-		raise RuntimeError("command '{}' return with error (code {}): {}".\
-		  format(e.cmd, e.returncode, e.output))
+def createStaticVisualisation(reporter,date,board,force=False,toSlack=False,channel=''):
+	o = "Example_{}.png".format(date)
+	reporter.static(board,colors=['g','y','pink','r','r','r','r','r'],output=o,reverse=True,force=force)
+	blurb = "Distribution of cards in {} {}".format(board,date)
+	if toSlack:
+		print(post_text(text=blurb, token=token, channel =channel))
+		print(post_image(filename=o, token=token, channels =channel))
+	else:
+		print("Not pushing {} to Slack".format(o))
 
 if __name__ == '__main__':
 	force = True
 	toSlack = False
-	board = 'MyBoard'
+	boards = ['MyBoard']
 	ch = '#reporting'
 	token = getToken('.slacktoken','slack')
 	today = arrow.utcnow().format("DD-MM-YYYY")
-	createStaticVisualisation(today,board,force=force,toSlack=toSlack,channel=ch)
+	# One reporter keeps the Trello client and Board lookups warm across reports
+	reporter = TrelloReporter(workdir='.slack')
+	for board in boards:
+		createStaticVisualisation(reporter,today,board,force=force,toSlack=toSlack,channel=ch)
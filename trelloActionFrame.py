@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+#
+# trelloActionFrame.py
+# --------------------
+# Compact columnar container for flattened Trello Card Actions.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+
+import array
+import calendar
+import time
+import numpy as np
+import pandas as pd
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Dates are always formatted with DATE_FORMAT so fields can be sliced directly
+toEpoch = lambda s: calendar.timegm((int(s[0:4]),int(s[5:7]),int(s[8:10]),int(s[11:13]),int(s[14:16]),int(s[17:19])))
+fromEpoch = lambda t: time.strftime(DATE_FORMAT,time.gmtime(int(t)))
+
+class Interner(object):
+    '''
+    Maps repeated strings onto dense integer codes. None maps to -1.
+    '''
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def intern(self,name):
+        if name is None:
+            return -1
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+    def __len__(self):
+        return len(self.names)
+
+class ActionFrameBuilder(object):
+    '''
+    Accumulates action dicts as produced by createActionDict into typed buffers
+    so that no per action dict has to be retained.
+    '''
+    def __init__(self):
+        self.vocab = {'board':Interner(),'list':Interner(),'actor':Interner(),'type':Interner(),'name':Interner()}
+        self.ids = []
+        self.cols = {c:array.array('i') for c in ['board','before','after','old','new','category','actor']}
+        self.card = array.array('q')
+        self.ts = array.array('q')
+        self.closed = array.array('b')
+
+    def append(self,d):
+        self.ids.append(d.get('action_id') or '')
+        self.cols['board'].append(self.vocab['board'].intern(d.get('board')))
+        self.cols['before'].append(self.vocab['list'].intern(d.get('before')))
+        self.cols['after'].append(self.vocab['list'].intern(d.get('after')))
+        self.cols['old'].append(self.vocab['name'].intern(d.get('old')))
+        self.cols['new'].append(self.vocab['name'].intern(d.get('new')))
+        self.cols['category'].append(self.vocab['type'].intern(d.get('category')))
+        self.cols['actor'].append(self.vocab['actor'].intern(d.get('actor')))
+        card = d.get('card')
+        self.card.append(-1 if card is None else int(card))
+        self.ts.append(toEpoch(d.get('date')))
+        self.closed.append(1 if d.get('closed') else 0)
+
+    def build(self):
+        codes = {c:np.frombuffer(buf,dtype=np.int32) if len(buf) else np.zeros(0,dtype=np.int32) for c,buf in self.cols.items()}
+        card = np.frombuffer(self.card,dtype=np.int64) if len(self.card) else np.zeros(0,dtype=np.int64)
+        ts = np.frombuffer(self.ts,dtype=np.int64) if len(self.ts) else np.zeros(0,dtype=np.int64)
+        closed = np.packbits(np.frombuffer(self.closed,dtype=np.int8).astype(bool))
+        ids = np.array(self.ids,dtype='S24')
+        vocab = {k:v.names for k,v in self.vocab.items()}
+        return ActionFrame(ids,codes,card,ts,closed,len(ts),vocab)
+
+class ActionFrame(object):
+    '''
+    Columnar replacement for a list of flattened action dicts:
+    - board, before/after list, category and actor held as int32 codes into shared vocabularies
+    - card as int64 idShort (-1 where missing)
+    - date as int64 epoch seconds (UTC)
+    - closed as a packed bitset
+    Rows keep the order in which actions were appended.
+    '''
+    COLUMN_VOCAB = {'board':'board','before':'list','after':'list','old':'name','new':'name','category':'type','actor':'actor'}
+
+    def __init__(self,ids,codes,card,ts,closedBits,size,vocab):
+        self.ids = ids
+        self.codes = codes
+        self.card = card
+        self.ts = ts
+        self.closedBits = closedBits
+        self.size = size
+        self.vocab = vocab
+        self.dateOrder = None
+        self.cardOrder = None
+
+    @classmethod
+    def fromRecords(cls,records):
+        builder = ActionFrameBuilder()
+        for d in records:
+            builder.append(d)
+        return builder.build()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def closed(self):
+        return np.unpackbits(self.closedBits)[:self.size].astype(bool)
+
+    def column(self,name):
+        return self.codes[name]
+
+    def names(self,name):
+        return self.vocab[self.COLUMN_VOCAB[name]]
+
+    def codeFor(self,name,value):
+        '''
+        Returns: code of value in the vocabulary of column name or -1 if unseen
+        '''
+        names = self.names(name)
+        return names.index(value) if value in names else -1
+
+    def getStart(self):
+        assert(self.size)
+        return fromEpoch(self.ts.min())
+
+    def take(self,indices):
+        '''
+        Returns: new ActionFrame holding rows at indices, sharing vocabularies
+        '''
+        indices = np.asarray(indices,dtype=np.int64)
+        codes = {c:v[indices] for c,v in self.codes.items()}
+        closed = np.packbits(self.closed[indices])
+        return ActionFrame(self.ids[indices],codes,self.card[indices],self.ts[indices],closed,len(indices),self.vocab)
+
+    def getDateOrder(self):
+        if self.dateOrder is None:
+            self.dateOrder = np.argsort(self.ts,kind='mergesort')
+        return self.dateOrder
+
+    def getCardOrder(self):
+        if self.cardOrder is None:
+            self.cardOrder = np.argsort(self.card,kind='mergesort')
+        return self.cardOrder
+
+    def indicesByDate(self,start=None,end=None):
+        '''
+        Returns: sorted row indices with start <= date <= end (date strings or epoch seconds)
+        '''
+        order = self.getDateOrder()
+        sortedTs = self.ts[order]
+        lo,hi = 0,len(order)
+        if start is not None:
+            lo = np.searchsorted(sortedTs,start if isinstance(start,(int,np.integer)) else toEpoch(start),side='left')
+        if end is not None:
+            hi = np.searchsorted(sortedTs,end if isinstance(end,(int,np.integer)) else toEpoch(end),side='right')
+        return np.sort(order[lo:hi])
+
+    def indicesByCard(self,cards):
+        '''
+        Returns: sorted row indices for the given card idShort values
+        '''
+        order = self.getCardOrder()
+        sortedCards = self.card[order]
+        cards = np.atleast_1d(np.asarray(cards,dtype=np.int64))
+        lo = np.searchsorted(sortedCards,cards,side='left')
+        hi = np.searchsorted(sortedCards,cards,side='right')
+        parts = [order[l:h] for l,h in zip(lo,hi) if h > l]
+        if not parts:
+            return np.zeros(0,dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def sliceByDate(self,start=None,end=None):
+        return self.take(self.indicesByDate(start,end))
+
+    def sliceByCard(self,cards):
+        return self.take(self.indicesByCard(cards))
+
+    def categorical(self,name,sortCategories=True):
+        '''
+        Returns: pandas Categorical for column name.  Sorted categories restricted
+        to values present match astype('category') but need the codes remapping;
+        otherwise the codes are used as they are against the whole vocabulary.
+        '''
+        codes = self.codes[name]
+        names = self.names(name)
+        if not sortCategories:
+            return pd.Categorical.from_codes(codes,categories=names)
+        used = np.unique(codes[codes >= 0])
+        order = sorted(range(len(used)),key=lambda i: names[used[i]])
+        remap = np.full(len(names)+1,-1,dtype=np.int32)
+        remap[used[order]] = np.arange(len(used),dtype=np.int32)
+        # codes of -1 index the trailing sentinel slot and stay missing
+        return pd.Categorical.from_codes(remap[codes],categories=[names[used[i]] for i in order])
+
+    def toDataFrame(self,sortCategories=True):
+        '''
+        Returns: DataFrame with the columns of flattenActions built directly from
+        the code arrays without re-creating per row strings for categorical columns.
+        By default categories are sorted as astype('category') would and ids are
+        decoded, which copies every column.  With sortCategories=False the frame is
+        built over the existing arrays instead: card and date (as datetime64[s]) are
+        views where pandas supports them, categoricals take the codes against the
+        vocabulary order (pandas may narrow them to a smaller integer type) and ids
+        stay bytes.  Only the packed closed flags always have to be expanded.
+        '''
+        columns = ['action_id','board','before','after','card','old','new','closed','date','category','actor']
+        data = {}
+        for name in ['board','before','after','old','new','category','actor']:
+            data[name] = self.categorical(name,sortCategories)
+        data['card'] = self.card
+        data['closed'] = self.closed
+        if not sortCategories:
+            data['action_id'] = self.ids
+            data['date'] = self.ts.view('datetime64[s]')
+            return pd.DataFrame(data,columns=columns,copy=False)
+        data['action_id'] = self.ids.astype(str)
+        data['date'] = self.ts.astype('datetime64[s]')
+        return pd.DataFrame(data,columns=columns)
+
+    def memoryUsage(self):
+        '''
+        Returns: approximate bytes held by the arrays
+        '''
+        return sum([v.nbytes for v in self.codes.values()]) + self.ids.nbytes + self.card.nbytes + self.ts.nbytes + self.closedBits.nbytes
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+#
+# trelloArrow.py
+# --------------
+# Arrow IPC export of processed actions, counts and card snapshots, and a reader
+# returning DataFrames backed by memory-mapped files.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+# Files are written as a single record batch so every column is one contiguous
+# buffer.  Readers memory-map the file and wrap fixed width columns without
+# nulls directly as numpy arrays, so several processes reading the same export
+# share its pages through the OS cache instead of each parsing its own copy.
+#
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Card snapshot columns which are flat enough to export
+CARD_COLUMNS = ['id','idShort','name','idList','list','closed','dateLastActivity','shortUrl']
+
+def writeTable(table,path):
+    with pa.OSFile(path,'wb') as sink:
+        writer = pa.RecordBatchFileWriter(sink,table.schema)
+        writer.write_table(table)
+        writer.close()
+    return path
+
+def writeActions(frame,path):
+    '''
+    Receives: ActionFrame
+    Writes its columns reusing the interned codes as Arrow dictionary indices
+    '''
+    arrays = [pa.array(frame.ids,type=pa.binary(24))]
+    names = ['action_id']
+    for name in ['board','before','after','old','new','category','actor']:
+        codes = frame.column(name)
+        indices = pa.array(codes,mask=codes < 0,type=pa.int32())
+        arrays.append(pa.DictionaryArray.from_arrays(indices,pa.array(frame.names(name),type=pa.string())))
+        names.append(name)
+    arrays.append(pa.array(frame.card,type=pa.int64()))
+    arrays.append(pa.array(frame.ts.astype('datetime64[s]'),type=pa.timestamp('s')))
+    arrays.append(pa.array(frame.closed,type=pa.bool_()))
+    names.extend(['card','date','closed'])
+    return writeTable(pa.Table.from_arrays(arrays,names),path)
+
+def writeCounts(counts,path):
+    '''
+    Receives: list of dict or DataFrame of open card counts by list, one per date
+    '''
+    df = pd.DataFrame(counts)
+    df = df.drop(columns=[c for c in df.columns if c.startswith('Unnamed')])
+    df['date'] = pd.to_datetime(df['date']).values.astype('datetime64[s]')
+    lists = [c for c in df.columns if c != 'date']
+    df[lists] = df[lists].fillna(0).astype(np.int64)
+    return writeTable(pa.Table.from_pandas(df[['date']+sorted(lists)],preserve_index=False),path)
+
+def writeCards(cards,path):
+    '''
+    Receives: list of dict or DataFrame of card data as from generateCards
+    '''
+    df = pd.DataFrame(cards)
+    df = df[[c for c in CARD_COLUMNS if c in df.columns]].copy()
+    if 'list' in df.columns:
+        df['list'] = df['list'].astype('category')
+    return writeTable(pa.Table.from_pandas(df,preserve_index=False),path)
+
+def toNumpy(array):
+    '''
+    Returns: numpy view over the data buffer of a fixed width Arrow array without
+    nulls, or None where a view is not possible
+    '''
+    types = {pa.int32():np.int32,pa.int64():np.int64,pa.float64():np.float64,
+             pa.timestamp('s'):'datetime64[s]',pa.binary(24):'S24'}
+    dtype = types.get(array.type)
+    if dtype is None or array.null_count:
+        return None
+    buf = array.buffers()[1]
+    return np.frombuffer(buf,dtype=dtype,count=array.offset+len(array))[array.offset:]
+
+def toDataFrame(table):
+    '''
+    Returns: DataFrame whose fixed width columns and categorical codes are views on
+    the table buffers; other columns are converted by pyarrow
+    '''
+    data = {}
+    for name in table.schema.names:
+        column = table.column(name)
+        array = column.chunks[0] if column.num_chunks == 1 else pa.concat_arrays(column.chunks)
+        values = None
+        if isinstance(array,pa.DictionaryArray):
+            codes = toNumpy(array.indices)
+            if codes is not None:
+                values = pd.Categorical.from_codes(codes,categories=array.dictionary.to_pylist())
+        else:
+            values = toNumpy(array)
+        if values is None:
+            values = array.to_pandas()
+        data[name] = values
+    return pd.DataFrame(data,columns=table.schema.names,copy=False)
+
+def readArrow(path):
+    '''
+    Returns: DataFrame over the memory-mapped Arrow IPC file at path
+    '''
+    source = pa.memory_map(path,'r')
+    table = pa.RecordBatchFileReader(source).read_all()
+    return toDataFrame(table)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#
+# trelloBenchmark.py
+# ------------------
+# Script to benchmark trelloDataProcessor stages on synthetic Board data.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+
+import os
+import sys
+import time
+import random
+import tempfile
+import datetime
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+from trelloDataProcessor import TrelloDataProcessor,parseMemorySize,RENDERERS
+from trelloActionFrame import ActionFrameBuilder
+
+PROGRAM             = __file__
+VERSION             = '0.1'
+
+def createSyntheticCounts(dates,lists,seed=1):
+    '''
+    Returns: list of dict of daily counts random walking per list as from getActionCountsOverTime
+    '''
+    random.seed(seed)
+    names = ['List {}'.format(i) for i in range(lists)]
+    level = {name:random.randrange(5,30) for name in names}
+    start = datetime.datetime(2015,1,1)
+    counts = []
+    for i in range(dates):
+        for name in names:
+            level[name] = max(0,level[name]+random.randint(-2,2))
+        dico = dict(level)
+        dico['date'] = (start+datetime.timedelta(days=i)).strftime('%Y-%m-%d %H:%M:%S')
+        counts.append(dico)
+    return counts
+
+def benchmarkRender(sizes,lists,renderers):
+    '''
+    Times createCardTimeSeriesStackedBarChart for each renderer and number of dates
+    '''
+    workdir = tempfile.mkdtemp()
+    dp = TrelloDataProcessor(True,workdir=workdir,renderCache=0)
+    print("{:>8} {:>8} {:>10} {:>12}".format('dates','renderer','seconds','bytes'))
+    for size in sizes:
+        counts = createSyntheticCounts(size,lists)
+        for renderer in renderers:
+            output = os.path.join(workdir,'{}_{}.png'.format(renderer,size))
+            t0 = time.time()
+            dp.createCardTimeSeriesStackedBarChart(counts,'Benchmark',[],counts[0]['date'],colors=[],output=output,renderer=renderer)
+            elapsed = time.time() - t0
+            print("{:>8} {:>8} {:>10.2f} {:>12}".format(size,renderer,elapsed,os.path.getsize(output)))
+
+def createSyntheticActions(count,lists,cards=1000,seed=1):
+    '''
+    Returns: ActionFrame of random card moves between lists
+    '''
+    random.seed(seed)
+    names = ['List {}'.format(i) for i in range(lists)]
+    start = datetime.datetime(2015,1,1)
+    builder = ActionFrameBuilder()
+    for i in range(count):
+        card = random.randrange(cards)
+        builder.append({'action_id':'{:024x}'.format(i),'board':'Benchmark','before':random.choice(names),
+            'after':random.choice(names),'card':card,'new':'Card {}'.format(card),'closed':random.random() < 0.05,
+            'date':(start+datetime.timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'category':'updateCard','actor':'Member {}'.format(i % 20)})
+    return builder.build()
+
+def benchmarkLoad(sizes,lists,repeat=3):
+    '''
+    Times loading actions and counts from the CSV files against memory-mapped Arrow IPC files
+    '''
+    import trelloArrow
+    workdir = tempfile.mkdtemp()
+    print("{:>8} {:>8} {:>8} {:>12} {:>10}".format('rows','data','format','bytes','seconds'))
+    for size in sizes:
+        data = {'actions':createSyntheticActions(size,lists),'counts':createSyntheticCounts(size,lists)}
+        for name,rows in data.items():
+            csvPath = os.path.join(workdir,'{}_{}.csv'.format(name,size))
+            arrowPath = os.path.join(workdir,'{}_{}.arrow'.format(name,size))
+            df = rows.toDataFrame() if name == 'actions' else pd.DataFrame(rows)
+            df.to_csv(csvPath)
+            if name == 'actions':
+                trelloArrow.writeActions(rows,arrowPath)
+            else:
+                trelloArrow.writeCounts(rows,arrowPath)
+            for fmt,path,load in [('csv',csvPath,pd.read_csv),('arrow',arrowPath,trelloArrow.readArrow)]:
+                t0 = time.time()
+                for i in range(repeat):
+                    load(path)
+                elapsed = (time.time() - t0)/repeat
+                print("{:>8} {:>8} {:>8} {:>12} {:>10.4f}".format(size,name,fmt,os.path.getsize(path),elapsed))
+
+class SyntheticBoardClient(object):
+    '''
+    Stands in for TrelloClient, generating pages of raw Board actions on demand so
+    that the benchmark itself holds no more of the crawl than a real client would.
+    '''
+    def __init__(self,count,lists,cards=1000,seed=1):
+        self.count = count
+        self.lists = ['List {}'.format(i) for i in range(lists)]
+        self.cards = cards
+        self.seed = seed
+
+    def getCardsByBoard(self,boardId,filter='open',fields=''):
+        return [{'id':'{:024x}'.format(card)} for card in range(self.cards)]
+
+    def iterActionsByBoard(self,boardId,since=None,filter='all'):
+        random.seed(self.seed)
+        start = datetime.datetime(2000,1,1)
+        # Newest first as Trello returns them
+        for hi in range(self.count,0,-1000):
+            page = []
+            for i in range(hi-1,max(0,hi-1000)-1,-1):
+                card = random.randrange(self.cards)
+                page.append({'id':'{:024x}'.format(i),'type':'updateCard',
+                    'date':(start+datetime.timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                    'memberCreator':{'fullName':'Member {}'.format(i % 20)},
+                    'data':{'board':{'name':'Benchmark'},'listBefore':{'name':random.choice(self.lists)},
+                            'listAfter':{'name':random.choice(self.lists)},
+                            'card':{'id':'{:024x}'.format(card),'idShort':card,'name':'Card {}'.format(card),'closed':random.random() < 0.05}}})
+            yield page
+
+    def getActionsByCard(self,cardIds):
+        return []
+
+def benchmarkMemory(count,lists,cards,maxMemory,bucket):
+    '''
+    Runs generateCardCounts over count synthetic actions and checks peak RSS against maxMemory
+    '''
+    from trelloReporter import generateCardCounts
+    from trelloDataProcessor import getPeakMemory,getCurrentMemory
+    workdir = tempfile.mkdtemp()
+    client = SyntheticBoardClient(count,lists,cards)
+    dp = TrelloDataProcessor(True,workdir=workdir,renderCache=0)
+    print("Baseline RSS {} bytes".format(getCurrentMemory()))
+    t0 = time.time()
+    counts = generateCardCounts(client,dp,'Benchmark',False,maxMemory,bucket,('Benchmark','board',[]))
+    elapsed = time.time() - t0
+    peak = getPeakMemory()
+    print("{} actions, {} dates in {:.1f}s, peak RSS {} bytes".format(count,len(counts),elapsed,peak))
+    if maxMemory:
+        print("{} budget of {} bytes".format('Within' if peak <= maxMemory else 'OVER',maxMemory))
+    return peak
+
+def main():
+    import docopt
+    usage="""
+
+        %s
+        --------------
+        Usage:
+        %s render [--sizes=<sizes>] [--lists=<n>] [--renderers=<renderers>]
+        %s load [--sizes=<sizes>] [--lists=<n>]
+        %s memory [--actions=<n>] [--lists=<n>] [--cards=<n>] [--max-memory=<size>] [--bucket=<bucket>]
+        %s -h | --help
+        %s -V | --version
+
+        Options:
+        -h --help                   Show this screen.
+        -V --version                Show version.
+        --sizes=<sizes>             Numbers of dates to render or rows to load [default: 50,500,2000,5000]
+        --lists=<n>                 Number of lists [default: 6]
+        --renderers=<renderers>     Renderers to compare [default: bars,area,step]
+        --actions=<n>               Number of synthetic Board actions [default: 1000000]
+        --cards=<n>                 Number of cards [default: 10000]
+        --max-memory=<size>         Memory budget, eg. 512M; omit to measure the in-memory path
+        --bucket=<bucket>           Time series step [default: day]
+
+        Examples:
+        1. Compare time series renderers on 3 and 10 years of daily counts:
+        %s render --sizes=1100,3650
+        2. Compare loading 100k and 1M rows of actions and counts from CSV and Arrow files:
+        %s load --sizes=100000,1000000
+        3. Check peak RSS stays within a 512MB budget while counting 10M actions:
+        %s memory --actions=10000000 --max-memory=512M
+        """ % tuple([PROGRAM] * 9)
+
+    arguments = docopt.docopt(usage)
+    if arguments.get('--version') or arguments.get('-V'):
+        print("%s version %s" % (PROGRAM,VERSION))
+    elif arguments.get('render'):
+        sizes = [int(s) for s in arguments.get('--sizes').split(',')]
+        renderers = [r for r in arguments.get('--renderers').split(',') if r in RENDERERS]
+        benchmarkRender(sizes,int(arguments.get('--lists')),renderers)
+    elif arguments.get('load'):
+        sizes = [int(s) for s in arguments.get('--sizes').split(',')]
+        benchmarkLoad(sizes,int(arguments.get('--lists')))
+    elif arguments.get('memory'):
+        maxMemory = arguments.get('--max-memory') and parseMemorySize(arguments.get('--max-memory'))
+        benchmarkMemory(int(arguments.get('--actions')),int(arguments.get('--lists')),int(arguments.get('--cards')),
+            maxMemory,arguments.get('--bucket'))
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
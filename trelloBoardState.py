@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# trelloBoardState.py
+# -------------------
+# Checkpointed index answering "which Cards were open on which List at time T"
+# over an ActionFrame without rescanning every action.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+# The state of a Card at T is the action visible at T (date <= T) which comes
+# first in original action order, exactly as the chunked path selects it.  Events
+# are kept sorted by date and every N events the winning action per Card is
+# snapshotted, so a query is a binary search to the nearest snapshot followed
+# by a replay of at most N events.
+#
+
+import arrow
+import numpy as np
+from trelloActionFrame import toEpoch
+
+# Marks a Card with no visible action yet; larger than any action position
+NO_ACTION = np.iinfo(np.int64).max
+
+def parseEpoch(dt):
+    '''
+    Receives: epoch seconds, datetime or any date string arrow parses, eg. '2018-08-31'
+    Returns: epoch seconds
+    '''
+    if isinstance(dt,(int,np.integer)):
+        return int(dt)
+    # Fast path for dates already in ActionFrame DATE_FORMAT
+    if isinstance(dt,str) and len(dt) == 19 and dt[10] == ' ':
+        return toEpoch(dt)
+    return toEpoch(arrow.get(dt).to('UTC').format('YYYY-MM-DD HH:mm:ss'))
+
+class BoardStateIndex(object):
+    def __init__(self,frame,rows,every=None):
+        '''
+        Receives: ActionFrame, indices of its card state actions, events between snapshots
+        '''
+        order = rows[np.argsort(frame.ts[rows],kind='mergesort')]
+        self.seq = order.astype(np.int64)
+        self.ts = frame.ts[order]
+        self.cards,slot = np.unique(frame.card[order],return_inverse=True)
+        self.slot = slot.astype(np.int64)
+        self.size = max(1,len(frame))
+        self.actionTs = frame.ts
+        self.actionCard = frame.card
+        self.actionAfter = frame.column('after')
+        self.actionClosed = frame.closed
+        self.lists = frame.names('after')
+        # By default snapshots take about twice the memory of the events themselves
+        self.every = every or max(1024,len(self.cards)//2)
+        self.snapshots = self.buildSnapshots()
+
+    def __len__(self):
+        return len(self.seq)
+
+    def applyEvents(self,state,lo,hi):
+        '''
+        Lowers each Card's winning action in state with events lo..hi in date order
+        '''
+        if hi <= lo:
+            return state
+        # One sort on a combined key orders by Card then action position
+        key = np.sort(self.slot[lo:hi]*self.size + self.seq[lo:hi])
+        slot,seq = key // self.size,key % self.size
+        first = np.ones(len(slot),dtype=bool)
+        first[1:] = slot[1:] != slot[:-1]
+        slot,seq = slot[first],seq[first]
+        state[slot] = np.minimum(state[slot],seq)
+        return state
+
+    def buildSnapshots(self):
+        state = np.full(len(self.cards),NO_ACTION,dtype=np.int64)
+        snapshots = [state.copy()]
+        for lo in range(0,len(self.seq)-self.every+1,self.every):
+            state = self.applyEvents(state,lo,lo+self.every)
+            snapshots.append(state.copy())
+        return np.array(snapshots)
+
+    def getWinners(self,dt):
+        '''
+        Receives: date string, datetime or epoch seconds
+        Returns: sorted positions of the action holding each visible Card's state at dt
+        '''
+        k = int(np.searchsorted(self.ts,parseEpoch(dt),side='right'))
+        s = k // self.every
+        state = self.applyEvents(self.snapshots[s].copy(),s*self.every,k)
+        return np.sort(state[state != NO_ACTION])
+
+    def getOpenActions(self,dt):
+        '''
+        Returns: positions of the actions counted as open Cards at dt
+        '''
+        winners = self.getWinners(dt)
+        # Only the earliest of several winners sharing a date is counted, as in countOpenCardsByList
+        _,first = np.unique(self.actionTs[winners],return_index=True)
+        counted = winners[first]
+        return counted[(self.actionAfter[counted] >= 0) & ~self.actionClosed[counted]]
+
+    def getCountsAt(self,dt):
+        '''
+        Returns: array of open card counts indexed by list code
+        '''
+        return np.bincount(self.actionAfter[self.getOpenActions(dt)],minlength=len(self.lists))
+
+    def getStateAt(self,dt):
+        '''
+        Receives: date string, datetime or epoch seconds
+        Returns: dict of open card counts and dict of sorted arrays of open card idShorts, both keyed by list
+        '''
+        counted = self.getOpenActions(dt)
+        # One sort on a combined key orders by list then idShort (idShort -1 when missing)
+        key = np.sort((self.actionAfter[counted].astype(np.int64) << 32) + self.actionCard[counted] + 1)
+        after,cards = key >> 32,(key & 0xffffffff) - 1
+        codes,starts = np.unique(after,return_index=True)
+        ends = np.append(starts[1:],len(after))
+        counts = {}
+        ids = {}
+        for code,lo,hi in zip(codes,starts,ends):
+            counts[self.lists[code]] = int(hi-lo)
+            ids[self.lists[code]] = cards[lo:hi]
+        return counts,ids
@@ -13,9 +13,17 @@
 # https://developers.trello.com/docs/api-introduction 
 
 import requests
+from concurrent.futures import ThreadPoolExecutor
 
 TRELLO_KEY_FILE     = '.ttrellokey'
 TRELLO_TOKEN_FILE   = '.ttrellotoken'
+# Trello batch API accepts at most 10 urls per request
+BATCH_SIZE          = 10
+BATCH_WORKERS       = 4
+
+def chunks(lst, n):
+    for i in range(0, len(lst), n):
+        yield lst[i:i+n]
 
 class TrelloClient(object):
     def __init__(self,handler,verbose=False):
@@ -48,6 +56,16 @@ class TrelloClient(object):
         lists = r.json()
         return lists
 
+    def getListCardCounts(self, boardId):
+        '''
+        Returns: lists on board, each with a minimal 'cards' array holding only card ids
+        '''
+        command = 'boards/{}/lists'.format(boardId)
+        params = {'key':self.apiKey,'token':self.apiToken,'fields':'name','cards':'open','card_fields':'idList'}
+        r = self.handler.getRequest(command,params=params,verbose=self.verbose)
+        lists = r.json()
+        return lists
+
     def getCardsByList(self, listId):
         command = 'lists/{}/cards'.format(listId) # gets all fields
         params = {'key':self.apiKey,'token':self.apiToken}
@@ -55,6 +73,89 @@ class TrelloClient(object):
         cards = r.json()
         return cards
 
+    def getCardsByBoard(self, boardId, filter='open', fields='idShort,idList,closed'):
+        '''
+        filter: open|closed|all
+        Returns: cards on board with only the given fields
+        '''
+        command = 'boards/{}/cards/{}'.format(boardId,filter)
+        params = {'key':self.apiKey,'token':self.apiToken,'fields':fields}
+        r = self.handler.getRequest(command,params=params,verbose=self.verbose)
+        cards = r.json()
+        return cards
+
+    def iterActionsByBoard(self, boardId, since=None, filter='all'):
+        '''
+        since: date string or action id, only newer actions are returned
+        Returns: generator of pages of board actions, newest first
+        '''
+        limit = 1000
+        before = None
+        while True:
+            command = 'boards/{}/actions'.format(boardId)
+            params = {'key':self.apiKey,'token':self.apiToken,'limit':limit,'filter':filter}
+            if since:
+                params['since'] = since
+            if before:
+                params['before'] = before
+            r = self.handler.getRequest(command,params=params,verbose=False)
+            actions = r.json()
+            self.verbose and print("{} actions found on board".format(len(actions)))
+            yield actions
+            if len(actions) < limit:
+                break
+            # Page backwards from the oldest action returned so far
+            before = actions[-1].get('id')
+
+    def getActionsByBoard(self, boardId, since=None, filter='all', maxActions=None):
+        '''
+        since: date string or action id, only newer actions are returned
+        maxActions: stop paging once at least this many actions have been found
+        Returns: single flat array of all board actions, newest first
+        '''
+        arr = []
+        for actions in self.iterActionsByBoard(boardId,since,filter):
+            arr.extend(actions)
+            if maxActions and len(arr) >= maxActions:
+                break
+        return arr
+
+    def createWebhook(self, callbackURL, modelId, description=''):
+        '''
+        Trello will issue a HEAD request to callbackURL which must return 200.
+        Returns: webhook dict
+        '''
+        params = {'key':self.apiKey,'token':self.apiToken,'callbackURL':callbackURL,'idModel':modelId,'description':description}
+        r = self.handler.postRequest('webhooks',params=params,verbose=self.verbose)
+        webhook = r.json()
+        return webhook
+
+    def getBatch(self, urls):
+        '''
+        Returns: list of results for up to BATCH_SIZE urls in one request, None for failed urls
+        '''
+        params = {'urls':','.join(urls),'key':self.apiKey,'token':self.apiToken}
+        r = self.handler.getRequest('batch/',params=params,verbose=self.verbose)
+        return [result.get('200') for result in r.json()]
+
+    def iterCardsByLists(self, listIds):
+        '''
+        Fetches cards for listIds through the batch API with batches in flight concurrently.
+        Returns: generator of (listId,cards) in listIds order, yielding as soon as each batch lands
+        '''
+        batches = list(chunks(listIds,BATCH_SIZE))
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as pool:
+            futures = [pool.submit(self.getBatch,['/lists/{}/cards'.format(id) for id in batch]) for batch in batches]
+            for batch,future in zip(batches,futures):
+                for listId,cards in zip(batch,future.result()):
+                    yield listId,cards or []
+
+    def getCardsByLists(self, listIds):
+        '''
+        Returns: dict of cards keyed by listId
+        '''
+        return dict(self.iterCardsByLists(listIds))
+
     def getActionsByList(self, lists):
         '''
         Returns: single flat array of all actions by list
@@ -77,23 +178,15 @@ class TrelloClient(object):
         Returns: single flat array of all actions by cardId
         '''
         arr = []
-        def chunks(lst, n):
-            for i in range(0, len(lst), n):
-                yield lst[i:i+n]
-        g = chunks(cardIds,10)
-        batches = list(g)
+        batches = list(chunks(cardIds,BATCH_SIZE))
         for i,batch in enumerate(batches):
             if self.verbose:
                 print("\tbatch {} of {}".format(i+1,len(batches)))
             else:
                 print('.', end='', flush=True)
             # Note use of Trello batch API
-            s = ','.join(['/cards/{}/actions?filter=all'.format(id) for id in batch])
-            params = {'urls':s,'key':self.apiKey,'token':self.apiToken}
-            r = self.handler.getRequest('batch/',params=params,verbose=self.verbose)
-            results = r.json()
-            for result in results:
-                actions = result.get('200')
+            results = self.getBatch(['/cards/{}/actions?filter=all'.format(id) for id in batch])
+            for actions in results:
                 if actions:
                     [arr.append(action) for action in actions]
         print("Completed {} batches".format(len(batches)))
@@ -8,69 +8,243 @@
 # Licence: GPLv3
 #
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from matplotlib import cm
-import seaborn as sns
-# use Seaborn styles
-sns.set()
 import os
+import csv
+import shutil
+import collections
+import hashlib
+import heapq
 import arrow
 import datetime
+import resource
+from trelloActionFrame import ActionFrame,toEpoch,fromEpoch
+from trelloBoardState import BoardStateIndex
 
-formatDateTime = lambda s: arrow.get(s).format('YYYY-MM-DD HH:mm:ss')
+def formatDateTime(s):
+    # Fast path for Trello UTC timestamps eg. '2018-08-31T21:00:00.000Z'
+    if isinstance(s,str) and len(s) >= 20 and s[10] == 'T' and s[-1] == 'Z':
+        return '{} {}'.format(s[:10],s[11:19])
+    return arrow.get(s).format('YYYY-MM-DD HH:mm:ss')
+
+# Action categories which change the List or closed state of a Card
+CARD_STATE_CATEGORIES = ['updateCard','createCard','deleteCard','moveCardToBoard']
+# Action categories which add or remove a Card in the current Board snapshot
+CARD_ADD_CATEGORIES = ['createCard','copyCard','emailCard','convertToCardFromCheckItem','moveCardToBoard']
+CARD_REMOVE_CATEGORIES = ['deleteCard','moveCardFromBoard']
+# Rough cost in bytes of one spilled action row once parsed into a chunk DataFrame
+ACTION_ROW_BYTES = 1024
+MIN_CHUNK_SIZE = 1000
+# Most spilled runs open at once while merging
+MERGE_FAN_IN = 64
+# Time series steps; counts are the board state sampled at each step
+BUCKETS = {'hour':pd.Timedelta(hours=1),'day':pd.Timedelta(days=1),'week':pd.Timedelta(weeks=1),'month':pd.DateOffset(months=1)}
+BUCKET_LABELS = {'hour':'%d-%m-%Y %H:%M','day':'%d-%m-%Y','week':'%d-%m-%Y','month':'%m-%Y'}
+# Time series renderers: one bar per date, or stacked areas/steps on a date axis
+RENDERERS = ['bars','area','step']
+RENDER_DPI = 100
+# Rendered charts are kept in the workdir keyed by a hash of their data and parameters
+RENDER_CACHE_DIR = '.renders'
+RENDER_CACHE_BYTES = 64 * 1024**2
+
+# matplotlib and seaborn are only imported once a chart actually needs drawing
+plt = ticker = mdates = cm = None
+
+def loadPlotting():
+    global plt,ticker,mdates,cm
+    if plt is None:
+        import matplotlib.pyplot as plt
+        import matplotlib.ticker as ticker
+        import matplotlib.dates as mdates
+        from matplotlib import cm
+        import seaborn as sns
+        # use Seaborn styles
+        sns.set()
+
+def parseMemorySize(s):
+    '''
+    Receives: memory size string such as '512M', '2G' or '1048576'
+    Returns: size in bytes
+    '''
+    units = {'K':1024,'M':1024**2,'G':1024**3}
+    s = s.strip().upper().rstrip('B')
+    if s and s[-1] in units:
+        return int(float(s[:-1]) * units[s[-1]])
+    return int(s)
+
+def decimateTimeSeries(df,width):
+    '''
+    Returns: df reduced to at most width rows plus its end points, keeping the last
+    row of each bin since counts are the board state at that date
+    '''
+    n = df.shape[0]
+    if n <= width:
+        return df
+    step = int(np.ceil(n/width))
+    idx = np.unique(np.concatenate([[0],np.arange(step-1,n,step),[n-1]]))
+    return df.iloc[idx]
+
+def getPeakMemory():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def getCurrentMemory():
+    '''
+    Returns: resident set size of this process in bytes, or the peak where /proc is unavailable
+    '''
+    try:
+        with open('/proc/self/statm','r') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (IOError,OSError,IndexError,ValueError):
+        return getPeakMemory()
 
 class TrelloDataProcessor(object):
-    def __init__(self,force,verbose=False):
+    def __init__(self,force,verbose=False,workdir='.',renderCache=RENDER_CACHE_BYTES):
         self.verbose = verbose
         self.force = force
+        self.workdir = workdir
+        self.renderCache = renderCache
+        self.stateIndex = None
         self.start = None
         self.cards = pd.DataFrame()
-        self.counts = pd.DataFrame()
-        if os.path.exists('cards.csv'):
-            self.cards = pd.read_csv('cards.csv')
-        if os.path.exists('counts.csv'):
-            self.counts = pd.read_csv('counts.csv')
+        # Counts keyed by bucket, loaded from the workdir on first use
+        self.counts = {}
+        if os.path.exists(self.path('cards.csv')):
+            self.cards = pd.read_csv(self.path('cards.csv'))
+
+    def path(self,name):
+        return os.path.join(self.workdir,name)
 
     def getCards(self):
         return self.cards
 
-    def getCounts(self):
-        return self.counts
+    def setCards(self,cards):
+        self.cards = pd.DataFrame(cards)
+
+    def countsPath(self,bucket='day'):
+        # Each bucket has its own file so counts are never plotted against another step;
+        # daily counts keep the original counts.csv that existing caches and readers use
+        if bucket == 'day':
+            return self.path('counts.csv')
+        return self.path('counts_{}.csv'.format(bucket))
+
+    def getCounts(self,bucket='day'):
+        if bucket not in self.counts:
+            counts = pd.DataFrame()
+            if os.path.exists(self.countsPath(bucket)):
+                counts = pd.read_csv(self.countsPath(bucket))
+            self.counts[bucket] = counts
+        return self.counts[bucket]
+
+    def setCounts(self,counts,bucket='day'):
+        self.counts[bucket] = pd.DataFrame(counts)
 
     def getStart(self):
         start = None
-        if os.path.exists('.start'):
-            with open('.start','r') as f:
+        if os.path.exists(self.path('.start')):
+            with open(self.path('.start'),'r') as f:
                 start = f.read()
         return start
 
     def setStart(self,start):
-        with open('.start','w') as f:
+        with open(self.path('.start'),'w') as f:
             f.write(start)
 
+    def getLastSync(self):
+        sync = None
+        if os.path.exists(self.path('.sync')):
+            with open(self.path('.sync'),'r') as f:
+                sync = f.read()
+        return sync
+
+    def saveCards(self,cards,sync):
+        '''
+        Receives: card snapshot and the Trello date it is current as of
+        '''
+        self.setCards(cards)
+        self.cards.to_csv(self.path('cards.csv'),index=False)
+        with open(self.path('.sync'),'w') as f:
+            f.write(sync)
+
+    def patchCards(self,actions,boardLists):
+        '''
+        Applies Board actions to the List membership held in the card snapshot:
+        new cards are added, moved cards relisted, archived and deleted cards removed.
+        Receives: Board actions newest first as returned by Trello, Board lists
+        Returns: list of dict of patched card data or None if a card is on a List
+        which is no longer on the Board
+        '''
+        names = {ls.get('id'):ls.get('name')[:13] for ls in boardLists}
+        cards = self.cards.drop(columns=[c for c in self.cards.columns if c.startswith('Unnamed')])
+        rows = collections.OrderedDict([(card.get('id'),card) for card in cards.to_dict('records')])
+        for action in reversed(actions):
+            data = action.get('data')
+            card = data.get('card')
+            category = action.get('type')
+            if not card:
+                continue
+            cardId = card.get('id')
+            listId = (data.get('listAfter') or data.get('list') or {}).get('id')
+            if category in CARD_REMOVE_CATEGORIES or card.get('closed'):
+                rows.pop(cardId,None)
+                continue
+            unarchived = card.get('closed') is False and (data.get('old') or {}).get('closed')
+            if cardId not in rows and not (category in CARD_ADD_CATEGORIES or unarchived):
+                # Changes to cards already archived
+                continue
+            if cardId not in rows or data.get('listAfter'):
+                if listId not in names:
+                    return None
+                row = rows.setdefault(cardId,{'id':cardId,'idShort':card.get('idShort'),'closed':False})
+                row['idList'] = listId
+            if card.get('name'):
+                rows[cardId]['name'] = card.get('name')
+        for row in rows.values():
+            if row.get('idList') not in names:
+                # The List was archived or moved off the Board so the snapshot cannot be patched
+                return None
+            # Names are taken from the current Lists so renamed Lists are picked up
+            row['list'] = names.get(row.get('idList'))
+        self.verbose and print("Patched {} actions into {} cards".format(len(actions),len(rows)))
+        return list(rows.values())
+
     def createCardDistributionBarChart(self, cards, desc, colors=None, reverse=False, output=None):
         df = pd.DataFrame(cards)
-        if self.force or not os.path.exists('cards.csv'):
-            df.to_csv('cards.csv')
+        if self.force or not os.path.exists(self.path('cards.csv')):
+            df.to_csv(self.path('cards.csv'))
         print("{} rows, {} columns".format(df.shape[0],df.shape[1]))
-        gps = df.groupby(['list'])
-        longest = 0
-        for i,gp in enumerate(gps):
-            self.verbose and print("{:02d} cards in '{}'".format(len(gp[1]),gp[0]))
-            longest = max(longest,len(gp[1]))
-        nrows = i+1
+        buckets = df.groupby(['list']).size()
+        return self.createListCountBarChart(buckets,desc,colors=colors,reverse=reverse,output=output)
+
+    def createListCountBarChart(self, buckets, desc, colors=None, reverse=False, output=None):
+        '''
+        Receives: Series or dict of card counts keyed by list name
+        Returns: name of the generated chart
+        '''
+        if isinstance(buckets,dict):
+            buckets = pd.Series(buckets).sort_index()
+        colors = colors or []
+        for name,count in buckets.items():
+            self.verbose and print("{:02d} cards in '{}'".format(count,name))
+        nrows = len(buckets)
+        longest = int(buckets.max()) if nrows else 0
         longest += int(longest/20)
         self.verbose and print("longest value={}".format(longest))
         today = arrow.utcnow().format("YYYY-MM-DD")
         if reverse:
-            buckets = df.groupby(['list']).size()[::-1]
+            buckets = buckets[::-1]
             colors = colors[::-1]
-        else:
-            buckets = df.groupby(['list']).size()
         if (nrows != len(colors)):
             print("Mismatch between number of colors {} and number of rows {} in graph!".format(len(colors),nrows))
+        if output:
+            name = output
+        else:
+            name = '{}Snapshot_{}.png'.format(desc, today)
+        key = self.getRenderKey('static',buckets,desc,colors,today,os.path.splitext(name)[1])
+        if self.getCachedRender(key,name):
+            return name
+        loadPlotting()
         cmap = cm.get_cmap('jet') 
         if longest > 50:
             if colors:
@@ -85,17 +259,15 @@ class TrelloDataProcessor(object):
             ax.set_xticklabels(list(range(0,longest)))
         ax.set_ylabel('Trello List')
         ax.set_xlabel('count')
-        if output:
-            name = output
-        else:
-            name = '{}Snapshot_{}.png'.format(desc, today)
         plt.savefig(name)
+        plt.close()
+        self.putCachedRender(key,name)
         return name
 
-    def createCardTimeSeriesStackedBarChart(self, counts, desc, selected, start, end=None, colors=None, output=None):
+    def createCardTimeSeriesStackedBarChart(self, counts, desc, selected, start, end=None, colors=None, output=None, bucket='day', renderer='bars'):
         df = pd.DataFrame(counts)
-        if self.force or not os.path.exists('counts.csv'):
-            df.to_csv('counts.csv')
+        if self.force or not os.path.exists(self.countsPath(bucket)):
+            df.to_csv(self.countsPath(bucket))
         df.date = pd.to_datetime(df.date)
         datetimeArr = list(map(formatDateTime,df['date'].tolist()))
         # Set index of df to 'date' column and then delete 
@@ -115,11 +287,24 @@ class TrelloDataProcessor(object):
         #    #colors = 'bgrcmyk'  # classic
         #    colors = ['#1f77b4','#ff7f0e','#2ca02c','#d62728','#9467bd','#8c564b','#e377c2','#7f7f7f','#bcbd22','#17becf'] # v2.0 default
         if not colors:
-            colors.append('cool') # default
+            colors = ['cool'] # default
+        if output:
+            name = output
+        else:
+            name = '{}TimeSeries_{}.png'.format(desc,today)
+        key = self.getRenderKey('timed',df[selected],desc,colors,bucket,renderer,today,os.path.splitext(name)[1])
+        if self.getCachedRender(key,name):
+            return name
+        loadPlotting()
+        cmap = None
         if colors[0] in ['summer','autumn','winter','spring','cool']:
             cmap = cm.get_cmap(colors[0])
             colors = None
-        if df.shape[0] > 50:
+        if renderer != 'bars':
+            figsize = (24,12) if df.shape[0] > 50 else (18,9)
+            title = '{} time series {}'.format(desc,today)
+            ax = self.plotTimeSeriesArea(df[selected],colors,cmap,renderer,bucket,title,figsize)
+        elif df.shape[0] > 50:
             print('Greater than 50 date values!')
             # More than 50 dates to plot => need to switch to default xaxis handling
             if colors:
@@ -134,7 +319,7 @@ class TrelloDataProcessor(object):
             # Every 4th ticklable shows the month and day
             #ticklabels[::4] = [item.strftime('%b %d') for item in df.index[::4]]
             # Every 12th ticklabel includes the year
-            ticklabels[::12] = [item.strftime('%d-%m-%Y') for item in df.index[::12]]
+            ticklabels[::12] = [item.strftime(BUCKET_LABELS[bucket]) for item in df.index[::12]]
             ax.xaxis.set_major_formatter(ticker.FixedFormatter(ticklabels))
             plt.xticks(rotation=90)
             #plt.gcf().autofmt_xdate()
@@ -154,7 +339,7 @@ class TrelloDataProcessor(object):
             # Every 4th ticklable shows the month and day
             #ticklabels[::4] = [item.strftime('%b %d') for item in df.index[::4]]
             # Every 12th ticklabel includes the year
-            ticklabels = [item.strftime('%d-%m-%Y') for item in df.index]
+            ticklabels = [item.strftime(BUCKET_LABELS[bucket]) for item in df.index]
             ax.xaxis.set_major_formatter(ticker.FixedFormatter(ticklabels))
             plt.xticks(rotation=90)
 
@@ -170,57 +355,331 @@ class TrelloDataProcessor(object):
         #ax.plot(kind='line')
         #ax.axvline(x=featurecomplete, ymin=0, ymax=40, linestyle=':',color='k')
         #
-        if output:
-            name = output
-        else:
-            name = '{}TimeSeries_{}.png'.format(desc,today)
         plt.subplots_adjust(top=0.8) # Provides margin at bottom to accommodate legend
         plt.subplots_adjust(bottom=0.2) # Provides margin at bottom to accommodate axis
-        plt.savefig(name)
+        plt.savefig(name,dpi=RENDER_DPI)
+        plt.close()
+        self.putCachedRender(key,name)
         return name
 
-    def getCardCounts(self,df,dt):
-        qfilter = "category=='updateCard' or category=='createCard' or category=='deleteCard' or category=='moveCardToBoard'"
-        if not dt:
-            dt = formatDateTime(datetime.datetime.now())
-            #today = arrow.utcnow().format("YYYY-MM-DD")
-        candidates = df[df.date <= dt].query(qfilter)
-        deduped = candidates.drop_duplicates(subset='card',keep='first').drop_duplicates(subset='date',keep='first')
+    def plotTimeSeriesArea(self, df, colors, cmap, renderer, bucket, title, figsize):
+        '''
+        Draws df as stacked areas, or steps for renderer 'step', on a real date axis
+        with at most one point per pixel column of the output.
+        Returns: axes
+        '''
+        df = decimateTimeSeries(df.fillna(0),int(figsize[0]*RENDER_DPI))
+        self.verbose and print("Rendering {} points".format(df.shape[0]))
+        if not colors:
+            n = df.shape[1]
+            colors = [cmap(i/max(1,n-1)) for i in range(n)]
+        kwargs = {'step':'post'} if renderer == 'step' else {}
+        fig,ax = plt.subplots(figsize=figsize)
+        ax.stackplot(df.index.to_pydatetime(),df.T.values,labels=[str(c) for c in df.columns],
+            colors=colors,rasterized=True,**kwargs)
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter(BUCKET_LABELS[bucket]))
+        ax.set_xlim(df.index[0],df.index[-1])
+        ax.set_title(title)
+        ax.legend(loc='upper left')
+        plt.xticks(rotation=90)
+        return ax
+
+    def getRenderKey(self,kind,data,*params):
+        '''
+        Receives: chart kind, Series or DataFrame being plotted and chart parameters
+        Returns: hex digest identifying the rendered chart
+        '''
+        h = hashlib.sha1()
+        h.update(repr((kind,RENDER_DPI,params)).encode('utf-8'))
+        h.update(repr(list(data.index)).encode('utf-8'))
+        if isinstance(data,pd.DataFrame):
+            h.update(repr(list(data.columns)).encode('utf-8'))
+        h.update(np.ascontiguousarray(data.fillna(-1).values,dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def getCachedRender(self,key,name):
+        '''
+        Returns: True if the chart for key was copied to name from the render cache
+        '''
+        if not self.renderCache:
+            return False
+        path = self.path(os.path.join(RENDER_CACHE_DIR,key+os.path.splitext(name)[1]))
+        if not os.path.exists(path):
+            return False
+        if not (os.path.exists(name) and os.path.samefile(path,name)):
+            shutil.copyfile(path,name)
+        # Touch so eviction drops the least recently used charts first
+        os.utime(path)
+        print("Using cached render for '{}'".format(name))
+        return True
+
+    def putCachedRender(self,key,name):
+        if not self.renderCache:
+            return
+        cache = self.path(RENDER_CACHE_DIR)
+        os.makedirs(cache,exist_ok=True)
+        shutil.copyfile(name,os.path.join(cache,key+os.path.splitext(name)[1]))
+        self.evictRenders()
+
+    def evictRenders(self):
+        '''
+        Removes least recently used charts until the render cache fits in renderCache bytes
+        '''
+        cache = self.path(RENDER_CACHE_DIR)
+        entries = []
+        for f in os.listdir(cache):
+            st = os.stat(os.path.join(cache,f))
+            entries.append((st.st_mtime,st.st_size,f))
+        total = sum(e[1] for e in entries)
+        for _,size,f in sorted(entries):
+            if total <= self.renderCache:
+                break
+            os.remove(os.path.join(cache,f))
+            total -= size
+            self.verbose and print("Evicted cached render '{}'".format(f))
+
+    def countOpenCardsByList(self,latest):
+        '''
+        Receives: DataFrame holding the latest action per card in original action order
+        Returns: dict of open card counts keyed by list
+        '''
+        deduped = latest.drop_duplicates(subset='date',keep='first')
         countsDico = deduped[deduped.closed==False].groupby(['after']).size().to_dict()
         return countsDico
 
-    def generateDateRange(self,start,end=None):
+    def generateDateRange(self,start,end=None,bucket='day'):
+        '''
+        Returns: list of date strings stepping by bucket from start up to and
+        including the first step at or after end
+        '''
         if not end:
             end = formatDateTime(datetime.datetime.now())
         print(start,end)
-        count = 0
-        drange = []
-        # convert start to a datetime
-        dt = arrow.get(start).datetime
-        et = arrow.get(end).datetime
-        drange.append(start)    
-        while dt < et:
-            dt = arrow.get(dt).datetime + datetime.timedelta(days=1)
-            day = formatDateTime(dt)
-            drange.append(formatDateTime(day))
-            count += 1
+        step = BUCKETS[bucket]
+        st,et = pd.Timestamp(start),pd.Timestamp(end)
+        if bucket == 'month':
+            # Offset each month from start so that day of month does not drift
+            months = max(0,(et.year-st.year)*12+et.month-st.month)+2
+            rng = pd.DatetimeIndex([st+pd.DateOffset(months=k) for k in range(months)])
+        else:
+            rng = pd.date_range(st,et+step,freq=step)
+        rng = rng[:rng.searchsorted(et)+1]
+        drange = [start] + list(rng[1:].strftime('%Y-%m-%d %H:%M:%S'))
         return drange
 
-    def getActionCountsOverTime(self,actions,start,end=None):
+    def getCardStateRows(self,frame):
+        '''
+        Returns: sorted indices of actions in frame which change card list or closed state
+        '''
+        types = [frame.codeFor('category',c) for c in CARD_STATE_CATEGORIES]
+        return np.nonzero(np.isin(frame.column('category'),types))[0]
+
+    def getActionCountsOverTime(self,actions,start,end=None,maxMemory=None,bucket='day'):
+        '''
+        Receives: ActionFrame or list of flattened action dicts
+        Returns: list of dict of open card counts by list, one per date
+        '''
+        if not isinstance(actions,ActionFrame):
+            actions = ActionFrame.fromRecords(actions)
+        print("{} actions, {} bytes".format(len(actions),actions.memoryUsage()))
+        if maxMemory:
+            chunkSize = self.getChunkSizeForBudget(maxMemory)
+            print("Processing actions in chunks of {}".format(chunkSize))
+            lists = self.spillActions(actions,self.path('actions.csv'))
+            return self.getActionCountsOverTimeChunked(self.path('actions.csv'),lists,start,end,chunkSize,bucket)
         counts = []
-        df = pd.DataFrame(actions)
-        print("{} rows, {} columns".format(df.shape[0],df.shape[1]))
-        df.date = pd.to_datetime(df.date)
-        df.card = df.card.fillna(-1).astype(int)
-        #df.list = ndf.list.astype('category')
-        df.category = df.category.astype('category')
-        df.board = df.board.astype('category')
-        df.after = df.after.astype('category')
-        df.actor = df.actor.astype('category')
-        dts = self.generateDateRange(start,end)
+        index = self.buildStateIndex(actions)
+        after = actions.column('after')
+        names = actions.names('after')
+        lists = sorted([(names[c],c) for c in np.unique(after[after >= 0])])
+        dts = self.generateDateRange(start,end,bucket)
         for dt in dts:
-            dico = self.getCardCounts(df,dt)
+            arr = index.getCountsAt(toEpoch(dt))
+            dico = {name:int(arr[code]) for name,code in lists}
             dico['date'] = dt
             counts.append(dico)
         assert(len(counts) == len(dts))
         return counts
+
+    def buildStateIndex(self,actions,every=None):
+        '''
+        Receives: ActionFrame or list of flattened action dicts, events between snapshots
+        Returns: BoardStateIndex over the card state actions, kept for getStateAt
+        '''
+        if not isinstance(actions,ActionFrame):
+            actions = ActionFrame.fromRecords(actions)
+        self.stateIndex = BoardStateIndex(actions,self.getCardStateRows(actions),every)
+        self.verbose and print("Indexed {} card state actions with {} snapshots".format(len(self.stateIndex),len(self.stateIndex.snapshots)))
+        return self.stateIndex
+
+    def getStateAt(self,dt):
+        '''
+        Receives: date string, datetime or epoch seconds
+        Returns: dict of open card counts and dict of open card idShorts, both keyed by list
+        '''
+        assert(self.stateIndex)
+        return self.stateIndex.getStateAt(dt)
+
+    def getChunkSizeForBudget(self,maxMemory):
+        '''
+        Receives: memory budget in bytes for the whole process
+        Returns: number of actions to load per chunk
+        '''
+        available = maxMemory - getCurrentMemory()
+        if available <= 0:
+            print("Memory budget {} already exceeded, using minimum chunk size".format(maxMemory))
+            return MIN_CHUNK_SIZE
+        # Leave half the headroom for card state, counts and pandas temporaries
+        return max(MIN_CHUNK_SIZE,int(available/2/ACTION_ROW_BYTES))
+
+    def spillActions(self,frame,path='actions.csv'):
+        '''
+        Writes the card state actions in frame to path in date order, recording each
+        action's original position in 'seq' so that the chunked pass can reproduce
+        the keep='first' semantics of the in-memory path.
+        Returns: sorted list of all 'after' list names
+        '''
+        rows = self.getCardStateRows(frame)
+        order = rows[np.argsort(frame.ts[rows],kind='mergesort')]
+        after = frame.column('after')
+        names = frame.names('after')
+        closed = frame.closed
+        with open(path,'w',newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['seq','card','date','after','closed'])
+            for i in order:
+                writer.writerow([i,frame.card[i],fromEpoch(frame.ts[i]),names[after[i]] if after[i] >= 0 else '',bool(closed[i])])
+        return sorted([names[c] for c in np.unique(after[after >= 0])])
+
+    def spillActionPages(self,pages,path='actions.csv',chunkSize=MIN_CHUNK_SIZE):
+        '''
+        Streaming equivalent of spillActions for a crawl which is never held in memory.
+        Card state actions are buffered up to chunkSize rows, each full buffer is sorted
+        by date and written out as a run and the runs are merged into path at the end.
+        Receives: iterable of pages of flattened action dicts in original action order
+        Returns: earliest action date and sorted list of all 'after' list names
+        '''
+        runs = []
+        rows = []
+        lists = set([])
+        start = None
+        seq = 0
+        try:
+            for page in pages:
+                for d in page:
+                    after,date = d.get('after'),d.get('date')
+                    if not after:
+                        continue
+                    lists.add(after)
+                    start = date if start is None or date < start else start
+                    if d.get('category') in CARD_STATE_CATEGORIES:
+                        card = d.get('card')
+                        rows.append((date,seq,-1 if card is None else int(card),after,bool(d.get('closed'))))
+                    seq += 1
+                if len(rows) >= chunkSize:
+                    runs.append(self.writeActionRun(rows,'{}.{}'.format(path,len(runs))))
+                    rows = []
+            if rows or not runs:
+                runs.append(self.writeActionRun(rows,'{}.{}'.format(path,len(runs))))
+            self.verbose and print("Merging {} runs of {} actions".format(len(runs),seq))
+            # Merge in passes so that no more than MERGE_FAN_IN runs are open at once
+            merged = len(runs)
+            while len(runs) > MERGE_FAN_IN:
+                group,runs = runs[:MERGE_FAN_IN],runs[MERGE_FAN_IN:]
+                runs.append(self.mergeActionRuns(group,'{}.{}'.format(path,merged)))
+                merged += 1
+            self.mergeActionRuns(runs,path,header=True)
+            runs = []
+        finally:
+            for run in runs:
+                if os.path.exists(run):
+                    os.remove(run)
+        return start,sorted(lists)
+
+    def writeActionRun(self,rows,path):
+        rows.sort()
+        with open(path,'w',newline='') as f:
+            writer = csv.writer(f)
+            for date,seq,card,after,closed in rows:
+                writer.writerow([seq,card,date,after,closed])
+        return path
+
+    def mergeActionRuns(self,runs,path,header=False):
+        '''
+        Merges sorted runs into path and removes them
+        Returns: path
+        '''
+        files = []
+        try:
+            for run in runs:
+                files.append(open(run,'r',newline=''))
+            # Dates sort as strings and seq breaks ties as the stable sort in spillActions does
+            readers = [csv.reader(f) for f in files]
+            with open(path,'w',newline='') as f:
+                writer = csv.writer(f)
+                if header:
+                    writer.writerow(['seq','card','date','after','closed'])
+                writer.writerows(heapq.merge(*readers,key=lambda row: (row[2],int(row[0]))))
+        finally:
+            for f in files:
+                f.close()
+            for run in runs:
+                if os.path.exists(run):
+                    os.remove(run)
+        return path
+
+    def applyActionsToCardState(self,state,rows):
+        '''
+        Receives: DataFrame of per card state, DataFrame of newly visible actions
+        Returns: per card state holding the earliest action in original order, sorted by seq
+        '''
+        if rows.empty:
+            return state
+        merged = pd.concat([state,rows]).sort_values('seq',kind='mergesort')
+        return merged.drop_duplicates(subset='card',keep='first')
+
+    def getActionCountsOverTimeChunked(self,path,lists,start,end=None,chunkSize=MIN_CHUNK_SIZE,bucket='day'):
+        '''
+        Out-of-core equivalent of getActionCountsOverTime working through spilled
+        actions in date-ordered chunks and carrying per card state between them.
+        '''
+        counts = []
+        # Lists with no open cards are counted as 0 as in the in-memory path
+        empty = {name:0 for name in lists}
+        dts = self.generateDateRange(start,end,bucket)
+        stamps = pd.to_datetime(pd.Series(dts)).tolist()
+        i = 0
+        state = None
+        reader = pd.read_csv(path,chunksize=chunkSize,dtype={'seq':'int64','card':'int64','after':object,'closed':bool})
+        for n,chunk in enumerate(reader):
+            if chunk.empty:
+                continue
+            chunk.date = pd.to_datetime(chunk.date)
+            chunk.after = pd.Categorical(chunk.after,categories=lists)
+            if state is None:
+                state = chunk.iloc[:0]
+            applied = 0
+            last = chunk.date.iloc[-1]
+            # Only dates strictly before the last date in this chunk are complete
+            while i < len(dts) and stamps[i] < last:
+                upto = int(chunk.date.searchsorted(stamps[i],side='right'))
+                state = self.applyActionsToCardState(state,chunk.iloc[applied:upto])
+                applied = upto
+                dico = dict(empty,**self.countOpenCardsByList(state))
+                dico['date'] = dts[i]
+                counts.append(dico)
+                i += 1
+            state = self.applyActionsToCardState(state,chunk.iloc[applied:])
+            self.verbose and print("chunk {}: {} actions, {} cards, peak RSS {}".format(n+1,len(chunk),len(state),getPeakMemory()))
+        if state is None:
+            state = pd.DataFrame({'seq':[],'card':[],'date':pd.to_datetime([]),
+                                  'after':pd.Categorical([],categories=lists),'closed':[]})
+        while i < len(dts):
+            dico = dict(empty,**self.countOpenCardsByList(state))
+            dico['date'] = dts[i]
+            counts.append(dico)
+            i += 1
+        assert(len(counts) == len(dts))
+        print("Peak RSS {} bytes".format(getPeakMemory()))
+        return counts
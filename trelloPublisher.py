@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+#
+# trelloPublisher.py
+# ------------------
+# Publishes generated reports to Slack channels and Google Drive folders from a
+# durable on-disk queue.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+# Each output is queued once per destination as a job file in the spool
+# directory, so uploads survive the reporter exiting and retry independently.
+# A drainer runs jobs on a bounded worker pool with a cap on the jobs in flight
+# per destination, so a slow or failing destination never starves the others.
+# Failed jobs are retried with exponential backoff and parked in 'failed' once
+# they run out of attempts, from where 'retry' puts them back in the queue.
+# Drive is authenticated interactively only when jobs are queued; the drainer
+# just loads the saved credentials so a Drive problem only fails Drive jobs.
+#
+
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import mimetypes
+import threading
+import subprocess
+import collections
+from concurrent.futures import ThreadPoolExecutor,wait,FIRST_COMPLETED
+
+PROGRAM             = __file__
+VERSION             = '0.1'
+
+PUBLISH_DIR         = '.publish'
+PUBLISH_WORKERS     = 8
+DESTINATION_WORKERS = 4
+MAX_ATTEMPTS        = 5
+# Seconds before the first retry, doubled for each further attempt
+RETRY_DELAY         = 5
+TEXT_TYPES          = ['.txt','.md']
+DRIVE_CREDENTIALS   = 'google_credentials'
+
+def parseDestination(s):
+    '''
+    Receives: destination such as 'slack:#reporting', 'drive:<folderId>' or 'drive'
+    Returns: kind,target
+    '''
+    kind,_,target = s.partition(':')
+    assert(kind in ['slack','drive'])
+    if kind == 'drive':
+        target = target or 'root'
+    assert(target)
+    return kind,target
+
+class TrelloPublisher(object):
+    def __init__(self,spool=PUBLISH_DIR,workers=PUBLISH_WORKERS,perDestination=DESTINATION_WORKERS,verbose=False):
+        self.spool = spool
+        self.workers = workers
+        self.perDestination = perDestination
+        self.verbose = verbose
+        self.clients = threading.local()
+        self.driveAuth = None
+        self.driveLock = threading.Lock()
+        for name in ['jobs','files','failed']:
+            os.makedirs(os.path.join(spool,name),exist_ok=True)
+
+    def saveJob(self,job,folder='jobs'):
+        path = os.path.join(self.spool,folder,'{}.json'.format(job.get('id')))
+        tmp = '{}.tmp'.format(path)
+        with open(tmp,'w') as f:
+            json.dump(job,f)
+        os.replace(tmp,path)
+
+    def removeJob(self,job):
+        os.remove(os.path.join(self.spool,'jobs','{}.json'.format(job.get('id'))))
+        # The spooled copy of the output goes once no queued or failed job still needs it
+        others = [j for j in self.loadJobs()+self.loadJobs('failed') if j.get('file') == job.get('file')]
+        if not others and os.path.exists(job.get('file')):
+            os.remove(job.get('file'))
+
+    def loadJobs(self,folder='jobs'):
+        jobs = []
+        folder = os.path.join(self.spool,folder)
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(folder,name),'r') as f:
+                        jobs.append(json.load(f))
+                except (IOError,ValueError):
+                    # Removed by a concurrent drainer or still being written
+                    pass
+        return sorted(jobs,key=lambda j: j.get('created'))
+
+    def enqueue(self,paths,destinations):
+        '''
+        Receives: output files and destinations such as 'slack:#reporting' or 'drive:<folderId>'
+        Returns: list of queued job ids
+        '''
+        destinations = [parseDestination(d) for d in destinations]
+        if 'drive' in [kind for kind,_ in destinations]:
+            # Authenticate while a user can still respond so a detached drainer reuses the saved credentials
+            from googleDriveHandler import GoogleDriveHandler
+            from googleDriveClient import GoogleDriveClient
+            GoogleDriveClient(GoogleDriveHandler(DRIVE_CREDENTIALS))
+        ids = []
+        for path in paths:
+            # Copy the output so later runs can overwrite it while uploads are pending
+            spooled = os.path.join(self.spool,'files','{}_{}'.format(uuid.uuid4().hex,os.path.basename(path)))
+            shutil.copyfile(path,spooled)
+            for kind,target in destinations:
+                job = {'id':uuid.uuid4().hex,'kind':kind,'target':target,'name':os.path.basename(path),
+                       'file':spooled,'attempts':0,'created':time.time(),'next':0}
+                self.saveJob(job)
+                ids.append(job.get('id'))
+        print("Queued {} outputs for {} destinations".format(len(paths),len(destinations)))
+        return ids
+
+    def getSlackClient(self):
+        if not hasattr(self.clients,'slack'):
+            from slackClient import SlackClient
+            self.clients.slack = SlackClient()
+        return self.clients.slack
+
+    def getDriveAuth(self):
+        '''
+        Returns: GoogleAuth loaded from the saved credentials, shared by all workers and
+        refreshed here so that PyDrive never falls back to interactive authentication
+        '''
+        with self.driveLock:
+            if self.driveAuth is None:
+                from googleDriveHandler import GoogleDriveHandler
+                self.driveAuth = GoogleDriveHandler(DRIVE_CREDENTIALS).loadSavedAuth()
+            elif self.driveAuth.access_token_expired:
+                self.driveAuth.Refresh()
+        return self.driveAuth
+
+    def getDriveClient(self):
+        auth = self.getDriveAuth()
+        # GoogleDrive instances are not thread safe so each worker has its own
+        if not hasattr(self.clients,'drive'):
+            from pydrive.drive import GoogleDrive
+            from googleDriveClient import GoogleDriveClient
+            self.clients.drive = GoogleDriveClient(None,drive=GoogleDrive(auth))
+        return self.clients.drive
+
+    def publish(self,job):
+        '''
+        Uploads one job to its destination, raising on failure
+        '''
+        kind,target,path,name = job.get('kind'),job.get('target'),job.get('file'),job.get('name')
+        if kind == 'slack':
+            slack = self.getSlackClient()
+            if os.path.splitext(name)[1] in TEXT_TYPES:
+                with open(path,'r') as f:
+                    responses = slack.post_text(f.read(),[target])
+            else:
+                responses = slack.post_image(path,[target],name=name)
+            for response in responses:
+                result = json.loads(response)
+                if not result.get('ok'):
+                    raise RuntimeError(result.get('error'))
+        else:
+            mimeType = mimetypes.guess_type(name)[0] or ''
+            self.getDriveClient().uploadFile(path,mimeType,folderId=target,title=name)
+
+    def drain(self):
+        '''
+        Publishes queued jobs until the spool is empty, picking up jobs queued meanwhile.
+        Returns: number of jobs published and number which ran out of attempts
+        '''
+        published = failed = 0
+        active = collections.Counter()
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                now = time.time()
+                inflight = set([job.get('id') for job in running.values()])
+                pending = [job for job in self.loadJobs() if job.get('id') not in inflight]
+                for job in pending:
+                    if len(running) >= self.workers:
+                        break
+                    destination = (job.get('kind'),job.get('target'))
+                    if job.get('next') <= now and active[destination] < self.perDestination:
+                        active[destination] += 1
+                        running[pool.submit(self.publish,job)] = job
+                if not running:
+                    if not pending:
+                        break
+                    time.sleep(max(0.1,min([job.get('next') for job in pending])-now))
+                    continue
+                done,_ = wait(list(running.keys()),timeout=1,return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    active[(job.get('kind'),job.get('target'))] -= 1
+                    try:
+                        future.result()
+                    except Exception as e:
+                        job['attempts'] += 1
+                        job['error'] = str(e)
+                        if job.get('attempts') >= MAX_ATTEMPTS:
+                            print("Giving up on '{}' to {} {}: '{}'".format(job.get('name'),job.get('kind'),job.get('target'),e))
+                            self.saveJob(job,'failed')
+                            os.remove(os.path.join(self.spool,'jobs','{}.json'.format(job.get('id'))))
+                            failed += 1
+                        else:
+                            job['next'] = time.time() + RETRY_DELAY * 2**(job.get('attempts')-1)
+                            self.verbose and print("Retrying '{}' to {} {}: '{}'".format(job.get('name'),job.get('kind'),job.get('target'),e))
+                            self.saveJob(job)
+                        continue
+                    self.verbose and print("Published '{}' to {} {}".format(job.get('name'),job.get('kind'),job.get('target')))
+                    self.removeJob(job)
+                    published += 1
+        return published,failed
+
+    def drainExclusive(self):
+        '''
+        Drains the spool unless another drainer already holds it; that drainer picks
+        up any jobs queued while it runs.
+        Returns: number of jobs published and failed, or None if another drainer is running
+        '''
+        with open(os.path.join(self.spool,'lock'),'w') as lock:
+            try:
+                fcntl.flock(lock,fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError,OSError):
+                return None
+            published,failed = self.drain()
+            fcntl.flock(lock,fcntl.LOCK_UN)
+        # Jobs queued between the last scan and unlocking would otherwise wait for the next run
+        if self.loadJobs():
+            result = self.drainExclusive()
+            if result:
+                published,failed = published+result[0],failed+result[1]
+        return published,failed
+
+    def handOff(self):
+        '''
+        Starts a detached drainer so the caller can exit without waiting for uploads
+        '''
+        log = open(os.path.join(self.spool,'publish.log'),'a')
+        here = os.path.dirname(os.path.abspath(__file__))
+        subprocess.Popen([sys.executable,os.path.join(here,'trelloPublisher.py'),'drain','--spool={}'.format(self.spool)],
+                         stdout=log,stderr=subprocess.STDOUT,stdin=subprocess.DEVNULL,start_new_session=True)
+        print("Publishing in the background, see '{}'".format(log.name))
+
+    def requeue(self):
+        '''
+        Moves jobs which ran out of attempts back into the queue with fresh attempts
+        Returns: number of jobs requeued
+        '''
+        jobs = self.loadJobs('failed')
+        for job in jobs:
+            job['attempts'] = 0
+            job['next'] = 0
+            job.pop('error',None)
+            self.saveJob(job)
+            os.remove(os.path.join(self.spool,'failed','{}.json'.format(job.get('id'))))
+        print("Requeued {} failed uploads".format(len(jobs)))
+        return len(jobs)
+
+    def status(self):
+        '''
+        Returns: dict of queued and failed job counts by destination
+        '''
+        counts = collections.Counter(['{}:{} queued'.format(j.get('kind'),j.get('target')) for j in self.loadJobs()])
+        counts.update(['{}:{} failed'.format(j.get('kind'),j.get('target')) for j in self.loadJobs('failed')])
+        return dict(counts)
+
+def main():
+    import docopt
+    usage="""
+
+        %s
+        --------------
+        Usage:
+        %s publish <files>... --to=<destinations> [--spool=<dir>] [--wait] [-v]
+        %s drain [--spool=<dir>] [-v]
+        %s retry [--spool=<dir>] [--wait] [-v]
+        %s status [--spool=<dir>]
+        %s -h | --help
+        %s -V | --version
+
+        Options:
+        -h --help                   Show this screen.
+        -v --verbose                Verbose mode.
+        -V --version                Show version.
+        --to=<destinations>         Comma separated slack:<channel> and drive[:<folderId>] destinations
+        --spool=<dir>               Directory holding queued uploads [default: .publish]
+        --wait                      Publish in the foreground rather than handing off
+
+        Examples:
+        1. Queue a chart for Slack and a Drive folder and return immediately:
+        %s publish MyBoardSnapshot.png --to="slack:#reporting,drive:0B1xYz"
+        2. Publish anything left in the queue, eg. from cron after a failure:
+        %s drain
+        3. Put uploads which ran out of attempts back in the queue once the destination is fixed:
+        %s retry
+        """ % tuple([PROGRAM] * 10)
+
+    arguments = docopt.docopt(usage)
+    verbose = arguments.get('--verbose') or arguments.get('-v')
+    if arguments.get('--version') or arguments.get('-V'):
+        print("%s version %s" % (PROGRAM,VERSION))
+        return
+    publisher = TrelloPublisher(arguments.get('--spool'),verbose=verbose)
+    if arguments.get('publish') or arguments.get('retry'):
+        if arguments.get('publish'):
+            publisher.enqueue(arguments.get('<files>'),arguments.get('--to').split(','))
+        else:
+            publisher.requeue()
+        if not arguments.get('--wait'):
+            publisher.handOff()
+            return
+    if arguments.get('status'):
+        print(json.dumps(publisher.status(),indent=2))
+        return
+    t0 = time.time()
+    result = publisher.drainExclusive()
+    if result is None:
+        print("Another drainer is already publishing from '{}'".format(publisher.spool))
+    else:
+        print("Published {} uploads with {} failures in {:.1f}s".format(result[0],result[1],time.time()-t0))
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)
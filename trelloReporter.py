@@ -13,24 +13,24 @@
 # $ pip install -r requirements.txt
 #
 
+import os
 import sys
+import json
+import arrow
 from trelloClient import TrelloClient
 from trelloRestHandler import TrelloRESTHandler
-from trelloDataProcessor import TrelloDataProcessor,formatDateTime
+from trelloDataProcessor import TrelloDataProcessor,formatDateTime,parseMemorySize,BUCKETS,RENDERERS
+from trelloActionFrame import ActionFrameBuilder
 
 PROGRAM             = __file__
 VERSION             = '0.5'
+# Card snapshots changed by more Board actions than this are fetched in full
+DELTA_MAX_ACTIONS   = 1000
+# Margin for clock skew between this host and Trello when recording a sync
+SYNC_MARGIN_MINUTES = 5
 
 camelCase = lambda s: ''.join(x for x in s.title() if not x.isspace())
 
-def findUniqueCardIdsForActions(actions):
-    cardIds = set([])
-    for action in actions:
-        cardId = action.get('data').get('card') and action.get('data').get('card').get('id')
-        if cardId:
-            cardIds.add(cardId)
-    return list(cardIds)
-
 def createActionDict(action):
     d = {}
     d['action_id'] = action.get('id')
@@ -51,17 +51,20 @@ def createActionDict(action):
     return d
 
 def flattenActions(actions):
-    arr = []
+    '''
+    Returns: ActionFrame of actions which have a target list
+    '''
+    builder = ActionFrameBuilder()
     for action in actions:
         d = createActionDict(action)
         if d.get('after'):
-            arr.append(d)
+            builder.append(d)
         else:
             #print(action.get('type'),action.get('before'))
             #print(action)
             # TBD: need to convert between list id and name for createCard
             pass
-    return arr
+    return builder.build()
 
 def getListsForTargetBoard(client,desc):
     '''
@@ -79,41 +82,149 @@ def getListsForTargetBoard(client,desc):
     #    print("{:02d}. name='{}', id={}".format(i,ls.get('name'),ls.get('id')))
     return boardName,boardId,boardLists
 
-def generateCards(client,boardName,verbose):
+def generateCards(client,boardName,verbose,target=None,cardsByList=None):
     '''
+    Receives: optional target of boardName,boardId,boardLists already resolved and
+    optional dict of cards keyed by listId already fetched
     Returns: list of dict of card data (list,name,id)
     '''
     # We have to go and pull and process all the data 
-    boardName,_,boardLists = getListsForTargetBoard(client,boardName)
+    boardName,_,boardLists = target or getListsForTargetBoard(client,boardName)
     # Get Cards on each target Board List
+    if cardsByList is None:
+        cardsByList = client.getCardsByLists([ls.get('id') for ls in boardLists])
     cards = []
     for ls in boardLists:
         id,name = ls.get('id'),ls.get('name')
-        listCards = client.getCardsByList(id)
+        listCards = cardsByList.get(id) or []
         for i,card in enumerate(listCards):
             if len(name) > 13:
                 name = name[:13]
             card['list'] = name
             cards.append(card)
             verbose and print("{:03d}. list='{}', name='{}', id={}".format(i,card.get('list'),card.get('name'),card.get('id')))
-        verbose and print("list='{}', listCards={}".format(card.get('list'),len(listCards)))
+        verbose and print("list='{}', listCards={}".format(name,len(listCards)))
     verbose and print("{} Board cards found".format(len(cards)))
     return cards
 
-def generateCardCounts(client,dp,boardName,verbose):
-    boardName,_,boardLists = getListsForTargetBoard(client,boardName)
-    # Get Actions on each List 
-    cardIds = findUniqueCardIdsForActions(client.getActionsByList(boardLists))
+def refreshCards(client,dp,boardName,verbose,target=None,force=False,cardsByList=None):
+    '''
+    Brings the card snapshot held by dp up to date by patching it with the Board actions
+    since its last sync, falling back to a full refresh when forced, when there is no
+    synced snapshot or when the delta is too large to patch.
+    Returns: list of dict of card data (list,name,id)
+    '''
+    boardName,boardId,boardLists = target or getListsForTargetBoard(client,boardName)
+    since = dp.getLastSync()
+    if since and not force and cardsByList is None and not dp.getCards().empty:
+        actions = client.getActionsByBoard(boardId,since=since,maxActions=DELTA_MAX_ACTIONS)
+        cards = None
+        if len(actions) < DELTA_MAX_ACTIONS:
+            cards = dp.patchCards(actions,boardLists)
+        if cards is not None:
+            print("Patched cards with {} actions since {}".format(len(actions),since))
+            dp.saveCards(cards,actions[0].get('date') if actions else since)
+            return cards
+        print("Unable to patch {} actions since {}, fetching all cards".format(len(actions),since))
+    # Actions from just before the fetch are replayed next time which is harmless
+    sync = arrow.utcnow().shift(minutes=-SYNC_MARGIN_MINUTES).format('YYYY-MM-DDTHH:mm:ss.SSS') + 'Z'
+    cards = generateCards(client,boardName,verbose,(boardName,boardId,boardLists),cardsByList)
+    dp.saveCards(cards,sync)
+    return cards
+
+def generateListCounts(client,boardName,verbose,target=None):
+    '''
+    Returns: dict of open card counts keyed by list name truncated as in generateCards
+    '''
+    if target:
+        boardName,boardId,_ = target
+    else:
+        boardId,boardName = client.getBoardByName(boardName)
+    assert(boardId)
+    counts = {}
+    for ls in client.getListCardCounts(boardId):
+        name = ls.get('name')[:13]
+        count = len(ls.get('cards'))
+        # Empty lists have no cards to group in the full path so are left out here too
+        if count:
+            counts[name] = counts.get(name,0) + count
+        verbose and print("list='{}', cards={}".format(name,count))
+    return counts
+
+def iterBoardCardActions(client,boardId,verbose):
+    '''
+    Finds every card on the board, archived ones included, from a single card listing
+    and takes their actions from the board action history.  Per card history is only
+    fetched for cards which have no actions in the board history.
+    Returns: generator of pages of card actions as each page arrives
+    '''
+    cardIds = set([card.get('id') for card in client.getCardsByBoard(boardId,filter='all',fields='id')])
     verbose and print("{} unique cards found".format(len(cardIds)))
-    actions = flattenActions(client.getActionsByCard(cardIds))
+    found = 0
+    covered = set([])
+    for page in client.iterActionsByBoard(boardId):
+        actions = [action for action in page if (action.get('data').get('card') or {}).get('id') in cardIds]
+        covered.update([action.get('data').get('card').get('id') for action in actions])
+        found += len(actions)
+        yield actions
+    missing = list(cardIds - covered)
+    verbose and print("{} board actions cover {} cards, {} cards need their own history".format(found,len(covered),len(missing)))
+    if missing:
+        yield client.getActionsByCard(missing)
+
+def getBoardCardActions(client,boardId,verbose):
+    '''
+    Returns: single flat array of card actions from iterBoardCardActions
+    '''
+    return [action for page in iterBoardCardActions(client,boardId,verbose) for action in page]
+
+def generateCardCounts(client,dp,boardName,verbose,maxMemory=None,bucket='day',target=None,actions=None):
+    '''
+    Receives: optional ActionFrame of Board card actions already crawled
+    Returns: list of dict of open card counts by list, one per date
+    '''
+    boardName,boardId,boardLists = target or getListsForTargetBoard(client,boardName)
+    if actions is None and maxMemory:
+        # Spill each page as it arrives so that neither the raw crawl nor an ActionFrame is held
+        chunkSize = dp.getChunkSizeForBudget(maxMemory)
+        print("Processing actions in chunks of {}".format(chunkSize))
+        pages = ([createActionDict(action) for action in page] for page in iterBoardCardActions(client,boardId,verbose))
+        start,lists = dp.spillActionPages(pages,dp.path('actions.csv'),chunkSize)
+        assert(start)
+        dp.setStart(start)
+        return dp.getActionCountsOverTimeChunked(dp.path('actions.csv'),lists,start,chunkSize=chunkSize,bucket=bucket)
+    if actions is None:
+        # Get Actions for every Card on the Board
+        actions = flattenActions(getBoardCardActions(client,boardId,verbose))
     verbose and print("{} unique card actions found".format(len(actions)))
     # Find minimum date in actions array and use that for start. 
-    dates = sorted([d.get('date') for d in actions])
-    start = dates[0]
+    start = actions.getStart()
     dp.setStart(start)
-    counts = dp.getActionCountsOverTime(actions,start)
+    counts = dp.getActionCountsOverTime(actions,start,maxMemory=maxMemory,bucket=bucket)
     return counts
 
+def watchBoard(client,boardName,port,callback,verbose):
+    '''
+    Runs the webhook watcher for boardName until interrupted
+    '''
+    from trelloWatcher import TrelloWatcher
+    boardName,boardId,boardLists = getListsForTargetBoard(client,boardName)
+    watcher = TrelloWatcher('.watch_{}.json'.format(camelCase(boardName)),verbose=verbose)
+    if watcher.loadCheckpoint():
+        if watcher.lastDate:
+            # Catch up on anything missed while the watcher was down
+            missed = client.getActionsByBoard(boardId,since=arrow.get(watcher.lastDate).isoformat())
+            watcher.applyActions(reversed(missed))
+            print("Applied {} actions since {}".format(len(missed),watcher.lastDate))
+    else:
+        watcher.seed(client.getCardsByBoard(boardId),boardLists)
+    onReady = None
+    if callback:
+        def onReady():
+            webhook = client.createWebhook(callback,boardId,'trelloReporter watch {}'.format(boardName))
+            print("Registered webhook {} for '{}'".format(webhook.get('id'),callback))
+    watcher.serve(port,onReady=onReady)
+
 def procTrelloArguments(arguments):
     boardName = arguments.get('--b')
     assert(boardName)
@@ -145,32 +256,231 @@ def findTargetInBoardLists(target,boardLists):
             return ls
     return None
 
+LABEL_NAME_EMOJI = {'bug':':bug:','world':':globe_spin:'}
+LABEL_COLOR_EMOJI = {'red':':red_circle:','blue':':blue_circle:'}
+
+def procLabel(name,color):
+    return LABEL_NAME_EMOJI.get(name) or LABEL_COLOR_EMOJI.get(color) or name
+
+def generateSummary(client,boardLists,tlists,cardsByList=None):
+    '''
+    Receives: client, list of dict of boardList entries, list of boardList names and
+    optional dict of cards keyed by listId already fetched
+    Returns: generator of summary lines, yielded as each batch of lists arrives
+    '''
+    targets = [ls for ls in [findTargetInBoardLists(target,boardLists) for target in tlists] if ls]
+    names = {ls.get('id'):ls.get('name') for ls in targets}
+    ids = [ls.get('id') for ls in targets]
+    if cardsByList is None:
+        listsCards = client.iterCardsByLists(ids)
+    else:
+        listsCards = [(id,cardsByList.get(id) or []) for id in ids]
+    for id,listCards in listsCards:
+        listname = names.get(id)
+        for i,card in enumerate(listCards):
+            labels = ' '.join(sorted([procLabel(l.get('name').lower(),l.get('color').lower()) for l in card.get('labels')]))
+            yield "{}-{:02d}. `{}` {} labels={}\n".format(listname,i+1,card.get('name'),card.get('shortUrl'),labels)
+
 def createSummary(client,boardLists,tlists):
     '''
     Receives: list of boardList names, list of dict of boardList entries
     Returns: summary string
     '''
-    s = ''
-    boardListNames = [b.get('name') for b in boardLists]
-    for target in tlists:
-        ls = findTargetInBoardLists(target,boardLists)
-        if ls:
-            id,listname = ls.get('id'),ls.get('name')
-            listCards = client.getCardsByList(id)
-            for i,card in enumerate(listCards):
-                name = card.get('name')
-                url = card.get('shortUrl')
-                def procLabel(name,color):
-                    if name in ['bug']:
-                        return ':{}:'.format(name)
-                    elif name in ['world']:
-                        return ':globe_spin:'
-                    elif color in ['red','blue']:
-                        return ':{}_circle:'.format(color)
-                    return name
-                labels = ' '.join(sorted([procLabel(l.get('name').lower(),l.get('color').lower()) for l in card.get('labels')]))
-                s += "{}-{:02d}. `{}` {} labels={}\n".format(listname,i+1,name,url,labels)
-    return s
+    return ''.join(generateSummary(client,boardLists,tlists))
+
+def createClient(verbose=False):
+    rootUrl = 'https://api.trello.com/1'
+    handler = TrelloRESTHandler(rootUrl)
+    return TrelloClient(handler,verbose)
+
+class TrelloReporter(object):
+    '''
+    In-process API for the boards, lists, summary, static and timed commands.
+    One instance holds an authenticated client, resolved boards and lists and
+    data processors so that many reports can be produced in one warm process.
+    With workdir set each board keeps its cached data in its own subdirectory,
+    otherwise the current directory is shared as on the command line.
+    '''
+    def __init__(self,client=None,force=False,verbose=False,workdir=None):
+        self.client = client or createClient(verbose)
+        self.force = force
+        self.verbose = verbose
+        self.workdir = workdir
+        self.targets = {}
+        self.processors = {}
+
+    def getProcessor(self,boardName):
+        key = boardName if self.workdir else None
+        if key not in self.processors:
+            workdir = '.'
+            if self.workdir:
+                workdir = os.path.join(self.workdir,camelCase(boardName))
+                os.makedirs(workdir,exist_ok=True)
+            self.processors[key] = TrelloDataProcessor(self.force,self.verbose,workdir=workdir)
+        return self.processors[key]
+
+    def getTarget(self,boardName):
+        '''
+        Returns: boardName,boardId,boardLists resolved once per board
+        '''
+        if boardName not in self.targets:
+            self.targets[boardName] = getListsForTargetBoard(self.client,boardName)
+        return self.targets[boardName]
+
+    def boards(self):
+        return self.client.getBoards()
+
+    def lists(self,boardName):
+        return self.getTarget(boardName)
+
+    def summary(self,boardName,tlists):
+        '''
+        Returns: generator of summary lines
+        '''
+        _,_,boardLists = self.getTarget(boardName)
+        return generateSummary(self.client,boardLists,tlists)
+
+    def static(self,boardName,colors=None,output=None,reverse=False,countsOnly=False,force=None,crawl=None):
+        '''
+        Receives: optional crawl of Board data shared between the outputs of a report
+        Returns: name of the generated static distribution chart
+        '''
+        force = self.force if force is None else force
+        crawl = {} if crawl is None else crawl
+        target = self.getTarget(boardName)
+        dp = self.getProcessor(boardName)
+        dp.force = force
+        desc = camelCase(boardName)
+        if countsOnly:
+            counts = crawl.get('listCounts')
+            if counts is None:
+                counts = generateListCounts(self.client,boardName,self.verbose,target)
+            return dp.createListCountBarChart(counts,desc,colors=colors,reverse=reverse,output=output)
+        cards = crawl.get('cards')
+        if cards is None:
+            cards = refreshCards(self.client,dp,boardName,self.verbose,target,force,crawl.get('cardsByList'))
+            crawl['cards'] = cards
+        return dp.createCardDistributionBarChart(cards,desc,colors=colors,reverse=reverse,output=output)
+
+    def timed(self,boardName,selected=None,colors=None,output=None,bucket='day',renderer='bars',maxMemory=None,force=None,crawl=None):
+        '''
+        Receives: optional crawl of Board data shared between the outputs of a report
+        Returns: name of the generated time series chart
+        '''
+        force = self.force if force is None else force
+        crawl = {} if crawl is None else crawl
+        target = self.getTarget(boardName)
+        dp = self.getProcessor(boardName)
+        dp.force = force
+        counts = crawl.setdefault('counts',{}).get(bucket)
+        if counts is None:
+            counts = dp.getCounts(bucket)
+            if force or counts.empty:
+                print("Forcing new card counts data generation")
+                counts = generateCardCounts(self.client,dp,boardName,self.verbose,maxMemory,bucket,target,crawl.get('actions'))
+                dp.setCounts(counts,bucket)
+            else:
+                print("Using existing '{}'".format(os.path.basename(dp.countsPath(bucket))))
+            crawl['counts'][bucket] = counts
+        start = dp.getStart()
+        return dp.createCardTimeSeriesStackedBarChart(counts,camelCase(boardName),selected or [],start,
+            colors=list(colors or []),output=output,bucket=bucket,renderer=renderer)
+
+    def export(self,boardName,outdir=None,bucket='day',force=None):
+        '''
+        Crawls boardName once and writes its actions, counts and card snapshot as
+        Arrow IPC files for memory-mapped reading with trelloArrow.readArrow.
+        Returns: list of exported file names
+        '''
+        import trelloArrow
+        force = self.force if force is None else force
+        target = self.getTarget(boardName)
+        dp = self.getProcessor(boardName)
+        dp.force = force
+        outdir = outdir or dp.workdir
+        os.makedirs(outdir,exist_ok=True)
+        actions = flattenActions(getBoardCardActions(self.client,target[1],self.verbose))
+        counts = generateCardCounts(self.client,dp,boardName,self.verbose,bucket=bucket,target=target,actions=actions)
+        dp.setCounts(counts,bucket)
+        cards = refreshCards(self.client,dp,boardName,self.verbose,target,force)
+        return [trelloArrow.writeActions(actions,os.path.join(outdir,'actions.arrow')),
+                trelloArrow.writeCounts(counts,os.path.join(outdir,'counts.arrow')),
+                trelloArrow.writeCards(cards,os.path.join(outdir,'cards.arrow'))]
+
+    def planReport(self,spec):
+        '''
+        Receives: report spec for one Board
+        Returns: set of Board data to crawl: 'cards', 'listCounts' and/or 'actions'
+        '''
+        force = spec.get('force',self.force)
+        dp = self.getProcessor(spec.get('board'))
+        outputs = spec.get('outputs',[])
+        kinds = [out.get('type') for out in outputs]
+        fetches = set([])
+        charts = [out for out in outputs if out.get('type') == 'static' and not out.get('countsOnly')]
+        # A synced card snapshot is patched from Board actions rather than fetched again
+        if 'summary' in kinds or (charts and (force or dp.getCards().empty or not dp.getLastSync())):
+            fetches.add('cards')
+        counted = [out for out in outputs if out.get('type') == 'static' and out.get('countsOnly')]
+        if counted and 'cards' not in fetches:
+            # Per list counts come for free with the cards otherwise
+            fetches.add('listCounts')
+        buckets = set([out.get('bucket','day') for out in outputs if out.get('type') == 'timed'])
+        if buckets and (force or any([dp.getCounts(bucket).empty for bucket in buckets])):
+            fetches.add('actions')
+        return fetches
+
+    def report(self,spec):
+        '''
+        Produces every output in spec from a single crawl of the Board.
+        Receives: dict with 'board', optional 'force' and list of 'outputs' each with a
+        'type' of lists|summary|static|timed and the options of that command
+        Returns: list of (type,output) for the generated outputs
+        '''
+        boardName = spec.get('board')
+        force = spec.get('force',self.force)
+        fetches = self.planReport(spec)
+        print("Report for '{}' crawling {}".format(boardName,','.join(sorted(fetches)) or 'nothing'))
+        target = self.getTarget(boardName)
+        _,boardId,boardLists = target
+        crawl = {}
+        if 'cards' in fetches:
+            cardsByList = self.client.getCardsByLists([ls.get('id') for ls in boardLists])
+            crawl['cardsByList'] = cardsByList
+            counts = {}
+            for ls in boardLists:
+                count = len(cardsByList.get(ls.get('id')) or [])
+                if count:
+                    counts[ls.get('name')[:13]] = counts.get(ls.get('name')[:13],0) + count
+            crawl['listCounts'] = counts
+        if 'listCounts' in fetches:
+            crawl['listCounts'] = generateListCounts(self.client,boardName,self.verbose,target)
+        if 'actions' in fetches:
+            crawl['actions'] = flattenActions(getBoardCardActions(self.client,boardId,self.verbose))
+        results = []
+        for out in spec.get('outputs',[]):
+            kind,output = out.get('type'),out.get('output')
+            if kind == 'lists':
+                dumpBoardLists(*target)
+            elif kind == 'summary':
+                lines = generateSummary(self.client,boardLists,out.get('lists',[]),crawl.get('cardsByList'))
+                if output:
+                    with open(output,'w') as f:
+                        f.writelines(lines)
+                else:
+                    sys.stdout.writelines(lines)
+            elif kind == 'static':
+                output = self.static(boardName,colors=out.get('colors'),output=output,reverse=out.get('reverse',False),
+                    countsOnly=out.get('countsOnly',False),force=force,crawl=crawl)
+            elif kind == 'timed':
+                output = self.timed(boardName,out.get('lists'),out.get('colors'),output,bucket=out.get('bucket','day'),
+                    renderer=out.get('renderer','bars'),force=force,crawl=crawl)
+            else:
+                print("Unknown report output type '{}'".format(kind))
+                continue
+            print("Generated {} output '{}'".format(kind,output))
+            results.append((kind,output))
+        return results
 
 def main():
     import docopt
@@ -182,8 +492,12 @@ def main():
         %s boards [-v]
         %s lists --b=<board> [-v]
         %s summary --b=<board> --l=<lists> [-v]
-        %s static --b=<board> [--c=<colors>] [--o=<output>] [-v] [-r] [-f]
-        %s timed --b=<board> [--l=<lists>] [--c=<colors>] [--o=<output>] [-v] [-f]
+        %s static --b=<board> [--c=<colors>] [--o=<output>] [-v] [-r] [-f] [--counts-only]
+        %s timed --b=<board> [--l=<lists>] [--c=<colors>] [--o=<output>] [--max-memory=<size>] [--bucket=<bucket>] [--renderer=<renderer>] [-v] [-f]
+        %s watch --b=<board> [--port=<port>] [--callback=<url>] [-v]
+        %s serve [--b=<board>] [--port=<port>] [--refresh=<seconds>] [-v]
+        %s report <spec> [--publish=<destinations>] [-v] [-f]
+        %s export --b=<board> [--o=<output>] [--bucket=<bucket>] [-v] [-f]
         %s -h | --help
         %s -V | --version
 
@@ -193,6 +507,14 @@ def main():
         -V --version            Show version.
         -r --reverse            Reverse bars
         -f --force              Force data regeneration
+        --counts-only           Fetch only per list card counts for static
+        --max-memory=<size>     Process actions in chunks to stay under memory budget eg. 512M
+        --bucket=<bucket>       Time series step: hour|day|week|month [default: day]
+        --renderer=<renderer>   Time series renderer: bars|area|step [default: bars]
+        --port=<port>           Port for watch webhook endpoint [default: 8080]
+        --callback=<url>        Public URL to register as Trello webhook callback
+        --refresh=<seconds>     Interval between background refreshes in serve [default: 3600]
+        --publish=<destinations>  Publish report outputs to slack:<channel> and drive[:<folderId>] destinations
 
         Examples:
         1. Get info on all Trello Boards:
@@ -209,7 +531,25 @@ def main():
         %s timed --b="My Board" --l="P1,P2,New P"--c=summer --o="output.png"
         7. Create time series visualisations of actions on Lists P1,P2,New P in 'My Board' with given colors:
         %s timed --b="My Board" --l="P1,P2,New P" --c="r,g,b"
-        """ % tuple([PROGRAM] * 15)
+        8. Create time series visualisation of 'My Board' staying under a 512MB memory budget:
+        %s timed --b="My Board" --max-memory=512M -f
+        9. Keep live counts for 'My Board' from Trello webhooks delivered to port 8080:
+        %s watch --b="My Board" --callback="https://example.com/trello"
+        10. Serve counts and charts over HTTP on port 8080, prewarming 'My Board' and 'Other Board':
+        %s serve --b="My Board,Other Board"
+        11. Create a weekly time series visualisation of 'My Board':
+        %s timed --b="My Board" --bucket=week -f
+        12. Create static visualisation of 'My Board' from a single request for per list counts:
+        %s static --b="My Board" --counts-only
+        13. Render a multi-year time series of 'My Board' as stacked areas on a date axis:
+        %s timed --b="My Board" --renderer=area
+        14. Produce every output listed in report.json from a single crawl of each Board:
+        %s report report.json
+        15. Export actions, counts and cards of 'My Board' as Arrow IPC files to directory 'exports':
+        %s export --b="My Board" --o=exports
+        16. Produce the reports in report.json and publish them to Slack and Drive in the background:
+        %s report report.json --publish="slack:#reporting,drive"
+        """ % tuple([PROGRAM] * 28)
 
     arguments = docopt.docopt(usage)
     #print(arguments)
@@ -230,10 +570,8 @@ def main():
     else:
         # Set up Trello client with our REST Handler
         try:
-            rootUrl = 'https://api.trello.com/1'
-            handler = TrelloRESTHandler(rootUrl)
-            client = TrelloClient(handler,verbose)
-            dp = TrelloDataProcessor(force)
+            reporter = TrelloReporter(force=force,verbose=verbose)
+            client = reporter.client
         except Exception as e:
             print(e)
             url = 'https://developers.trello.com/docs/api-introduction'
@@ -241,44 +579,81 @@ def main():
             print("Please check {} for how to set up Trello API credentials".format(url))
             sys.exit()
         if arguments.get('boards'):
-            boards = client.getBoards()
+            boards = reporter.boards()
             dumpBoards(boards)
         elif arguments.get('lists'):
             boardName,tlists,tcolors,_ = procTrelloArguments(arguments)
-            boardName,boardId,boardLists = getListsForTargetBoard(client,boardName)
+            boardName,boardId,boardLists = reporter.lists(boardName)
             dumpBoardLists(boardName,boardId,boardLists)
         elif arguments.get('summary'):
             boardName,tlists,_,_ = procTrelloArguments(arguments)
-            boardName,boardId,boardLists = getListsForTargetBoard(client,boardName)
-            listSummary = createSummary(client,boardLists,tlists)
-            print(listSummary)
+            for line in reporter.summary(boardName,tlists):
+                sys.stdout.write(line)
+            print()
         elif arguments.get('static'):
             boardName,lists,colors,output = procTrelloArguments(arguments)
             print(lists)
             print(colors)
-            cards = dp.getCards()
-            if force or cards.empty:
-                print("Forcing new cards data generation")
-                cards = generateCards(client,boardName,verbose)
-            else:
-                print("Using existing 'cards.csv'")
             # Create a visualisation of the static card distribution by List 
-            graph = dp.createCardDistributionBarChart(cards,camelCase(boardName),colors=colors,reverse=reverse,output=output)
+            graph = reporter.static(boardName,colors=colors,output=output,reverse=reverse,countsOnly=arguments.get('--counts-only'))
             print("Generated static card distribution in '{}'".format(graph))
             #plt.show()
         elif arguments.get('timed'):
             boardName,selected,colors,output = procTrelloArguments(arguments)
-            counts = dp.getCounts()
-            start = dp.getStart()
-            if force or counts.empty:
-                print("Forcing new card counts data generation")
-                counts = generateCardCounts(client,dp,boardName,verbose)
-            else:
-                print("Using existing 'counts.csv'")
+            bucket = arguments.get('--bucket')
+            if bucket not in BUCKETS:
+                print("Unknown bucket '{}', expected one of {}".format(bucket,','.join(BUCKETS.keys())))
+                sys.exit()
+            renderer = arguments.get('--renderer')
+            if renderer not in RENDERERS:
+                print("Unknown renderer '{}', expected one of {}".format(renderer,','.join(RENDERERS)))
+                sys.exit()
+            maxMemory = None
+            if arguments.get('--max-memory'):
+                maxMemory = parseMemorySize(arguments.get('--max-memory'))
             # Create a visualisation of the time series distribution of Cards 
-            graph = dp.createCardTimeSeriesStackedBarChart(counts,camelCase(boardName),selected,start,colors=colors,output=output)
+            graph = reporter.timed(boardName,selected,colors,output,bucket=bucket,renderer=renderer,maxMemory=maxMemory)
             print("Generated time series distribution in '{}'".format(graph))
             #plt.show()
+        elif arguments.get('watch'):
+            boardName,_,_,_ = procTrelloArguments(arguments)
+            watchBoard(client,boardName,int(arguments.get('--port')),arguments.get('--callback'),verbose)
+        elif arguments.get('report'):
+            with open(arguments.get('<spec>'),'r') as f:
+                spec = json.load(f)
+            # A spec is one Board report or a list of them
+            if isinstance(spec,list):
+                # Boards must not share cached cards and counts in the current directory
+                reporter = TrelloReporter(client,force=force,verbose=verbose,workdir='.')
+            publisher = None
+            for boardSpec in (spec if isinstance(spec,list) else [spec]):
+                results = reporter.report(boardSpec)
+                destinations = boardSpec.get('publish') or []
+                if arguments.get('--publish'):
+                    destinations = destinations + arguments.get('--publish').split(',')
+                paths = [output for _,output in results if output]
+                if destinations and paths:
+                    from trelloPublisher import TrelloPublisher
+                    publisher = publisher or TrelloPublisher(verbose=verbose)
+                    publisher.enqueue(paths,destinations)
+            if publisher:
+                # Uploads carry on after we exit
+                publisher.handOff()
+        elif arguments.get('export'):
+            boardName,_,_,output = procTrelloArguments(arguments)
+            bucket = arguments.get('--bucket')
+            if bucket not in BUCKETS:
+                print("Unknown bucket '{}', expected one of {}".format(bucket,','.join(BUCKETS.keys())))
+                sys.exit()
+            for path in reporter.export(boardName,output,bucket=bucket):
+                print("Exported '{}'".format(path))
+        elif arguments.get('serve'):
+            from trelloService import TrelloService
+            boardNames = []
+            if arguments.get('--b'):
+                boardNames = arguments.get('--b').split(',')
+            service = TrelloService(client,interval=int(arguments.get('--refresh')),verbose=verbose)
+            service.serve(int(arguments.get('--port')),boardNames)
 
 if __name__ == "__main__":
     main()
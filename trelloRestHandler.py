@@ -57,12 +57,12 @@ class TrelloRESTHandler(object):
             print("Failed: '{}'".format(e))
         return r
 
-    def postRequest(self,command,body='',headers={},verbose=False):
+    def postRequest(self,command,body='',headers={},params={},verbose=False):
         #auth = requests.auth.HTTPBasicAuth(username,password)
         url = '{}/{}'.format(self.root,command)
         custom_headers = {'Accept': 'application/json','Content-Type': 'application/json'}
         custom_headers = {**custom_headers,**headers}
-        req = requests.Request('POST',url,headers=custom_headers,data=body)
+        req = requests.Request('POST',url,params=params,headers=custom_headers,data=body)
         prepared = req.prepare()
         verbose and self.dumpRequest(prepared,isPost=True)
         s = requests.Session()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+#
+# trelloService.py
+# ----------------
+# Long-running HTTP service serving Trello Board counts and charts from warm caches.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+# Endpoints:
+# GET  /boards                          known boards and when they were refreshed
+# GET  /boards/<board>/counts           time series counts as JSON
+# GET  /boards/<board>/distribution     current card count per list as JSON
+# GET  /boards/<board>/static.png|svg   static distribution chart [?c=colors&r=1]
+# GET  /boards/<board>/timed.png|svg    time series chart [?c=colors&l=lists]
+# POST /boards/<board>/refresh          schedule a background refresh
+#
+
+import os
+import json
+import time
+import threading
+import collections
+import urllib.parse
+import matplotlib
+# Charts are only ever rendered to files
+matplotlib.use('Agg')
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from trelloDataProcessor import TrelloDataProcessor
+from trelloReporter import generateCards,generateCardCounts,camelCase
+
+CHART_TYPES = {'png':'image/png','svg':'image/svg+xml'}
+DEFAULT_CHARTS = [('static','png'),('timed','png')]
+# Rendered charts kept per board, least recently used dropped first
+CHART_CACHE_SIZE = 32
+
+class TrelloService(object):
+    def __init__(self,client,workdir='.serve',interval=3600,verbose=False):
+        self.client = client
+        self.workdir = workdir
+        self.interval = interval
+        self.verbose = verbose
+        self.boards = {}
+        self.inflight = {}
+        self.lock = threading.Lock()
+        # pyplot keeps global state so renders are serialised
+        self.renderLock = threading.Lock()
+
+    def refresh(self,boardName):
+        '''
+        Crawls boardName and swaps in fresh data. Concurrent callers for the same
+        board wait on the single refresh already in flight.
+        '''
+        with self.lock:
+            done = self.inflight.get(boardName)
+            leader = done is None
+            if leader:
+                done = self.inflight[boardName] = threading.Event()
+        if not leader:
+            done.wait()
+            return
+        try:
+            self.doRefresh(boardName)
+        except Exception as e:
+            print("Failed to refresh '{}': '{}'".format(boardName,e))
+        finally:
+            with self.lock:
+                del self.inflight[boardName]
+            done.set()
+
+    def doRefresh(self,boardName):
+        t0 = time.time()
+        workdir = os.path.join(self.workdir,camelCase(boardName))
+        os.makedirs(workdir,exist_ok=True)
+        dp = TrelloDataProcessor(True,self.verbose,workdir=workdir)
+        cards = generateCards(self.client,boardName,self.verbose)
+        counts = generateCardCounts(self.client,dp,boardName,self.verbose)
+        distribution = collections.Counter([card.get('list') for card in cards])
+        lists = sorted(set([name for row in counts for name in row if name != 'date']))
+        entry = {'dp':dp,'cards':cards,'counts':counts,'lists':lists,'start':dp.getStart(),
+                 'distribution':dict(distribution),'charts':collections.OrderedDict(),'refreshed':time.time()}
+        for kind,fmt in DEFAULT_CHARTS:
+            self.renderChart(boardName,entry,kind,fmt,(),(),False)
+        with self.lock:
+            self.boards[boardName] = entry
+        print("Refreshed '{}' in {:.1f}s".format(boardName,time.time()-t0))
+
+    def getEntry(self,boardName):
+        entry = self.boards.get(boardName)
+        if entry is None:
+            self.refresh(boardName)
+            entry = self.boards.get(boardName)
+        return entry
+
+    def renderChart(self,boardName,entry,kind,fmt,colors,lists,reverse):
+        '''
+        Returns: chart bytes, rendered once per distinct set of parameters
+        '''
+        key = (kind,fmt,colors,lists,reverse)
+        chart = self.getCachedChart(entry,key)
+        if chart:
+            return chart
+        with self.renderLock:
+            chart = self.getCachedChart(entry,key)
+            if chart:
+                return chart
+            dp = entry['dp']
+            output = dp.path('{}.{}'.format(kind,fmt))
+            desc = camelCase(boardName)
+            if kind == 'static':
+                dp.createCardDistributionBarChart(entry['cards'],desc,colors=list(colors),reverse=reverse,output=output)
+            else:
+                dp.createCardTimeSeriesStackedBarChart(entry['counts'],desc,list(lists),entry['start'],colors=list(colors),output=output)
+            with open(output,'rb') as f:
+                chart = f.read()
+            with self.lock:
+                entry['charts'][key] = chart
+                while len(entry['charts']) > CHART_CACHE_SIZE:
+                    entry['charts'].popitem(last=False)
+        return chart
+
+    def getCachedChart(self,entry,key):
+        with self.lock:
+            chart = entry['charts'].get(key)
+            if chart:
+                entry['charts'].move_to_end(key)
+            return chart
+
+    def refreshAll(self):
+        while True:
+            time.sleep(self.interval)
+            for boardName in list(self.boards.keys()):
+                self.refresh(boardName)
+
+    def serve(self,port,boardNames=[],host=''):
+        for boardName in boardNames:
+            threading.Thread(target=self.refresh,args=(boardName,),daemon=True).start()
+        threading.Thread(target=self.refreshAll,daemon=True).start()
+        server = ThreadingHTTPServer((host,port),makeServiceHandler(self))
+        server.daemon_threads = True
+        print("Serving Trello reports on port {}".format(port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+def makeServiceHandler(service):
+    class ServiceHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def reply(self,status,body=b'',contentType='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type',contentType)
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def replyJson(self,obj):
+            self.reply(200,json.dumps(obj,default=str).encode('utf-8'))
+
+        def parse(self):
+            url = urllib.parse.urlparse(self.path)
+            parts = [urllib.parse.unquote(p) for p in url.path.strip('/').split('/')]
+            query = urllib.parse.parse_qs(url.query)
+            return parts,query
+
+        def do_GET(self):
+            parts,query = self.parse()
+            if parts == ['boards']:
+                self.replyJson({name:entry.get('refreshed') for name,entry in service.boards.items()})
+                return
+            if len(parts) != 3 or parts[0] != 'boards':
+                self.reply(404)
+                return
+            boardName,resource = parts[1],parts[2]
+            entry = service.getEntry(boardName)
+            if entry is None:
+                self.reply(502)
+            elif resource == 'counts':
+                self.replyJson(entry['counts'])
+            elif resource == 'distribution':
+                self.replyJson(entry['distribution'])
+            else:
+                kind,_,fmt = resource.partition('.')
+                if kind not in ['static','timed'] or fmt not in CHART_TYPES:
+                    self.reply(404)
+                    return
+                split = lambda k: tuple(query.get(k,[''])[0].split(',')) if query.get(k) else ()
+                reverse = query.get('r',['0'])[0] not in ['0','']
+                lists = split('l') if kind == 'timed' else ()
+                unknown = [name for name in lists if name not in entry['lists']]
+                if unknown:
+                    self.reply(400,json.dumps({'error':'unknown lists','lists':unknown}).encode('utf-8'))
+                    return
+                try:
+                    chart = service.renderChart(boardName,entry,kind,fmt,split('c'),lists,reverse)
+                except Exception as e:
+                    print("Failed to render {} for '{}': '{}'".format(resource,boardName,e))
+                    self.reply(500,json.dumps({'error':str(e)}).encode('utf-8'))
+                    return
+                self.reply(200,chart,CHART_TYPES[fmt])
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length',0)))
+            parts,_ = self.parse()
+            if len(parts) != 3 or parts[0] != 'boards' or parts[2] != 'refresh':
+                self.reply(404)
+                return
+            threading.Thread(target=service.refresh,args=(parts[1],),daemon=True).start()
+            self.reply(202)
+
+        def log_message(self,format,*args):
+            service.verbose and BaseHTTPRequestHandler.log_message(self,format,*args)
+    return ServiceHandler
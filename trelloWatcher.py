@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+#
+# trelloWatcher.py
+# ----------------
+# Long-running receiver of Trello webhook callbacks maintaining live open
+# Card counts per List for a Board.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+# Trello delivers one POST per action to the registered callback URL.  Each
+# request is parsed and queued by the HTTP handler; a single applier thread
+# updates per Card state and the current day counts so each action costs O(1).
+# State is checkpointed to disk so the watcher can restart without a crawl.
+#
+
+import os
+import json
+import queue
+import threading
+import collections
+import arrow
+from http.server import BaseHTTPRequestHandler,ThreadingHTTPServer
+from trelloReporter import createActionDict
+from trelloDataProcessor import CARD_STATE_CATEGORIES
+
+REMOVE_CATEGORIES = ['deleteCard','moveCardFromBoard']
+RECENT_ACTIONS = 10000
+
+class TrelloWatcher(object):
+    def __init__(self,checkpoint,checkpointEvery=1000,verbose=False):
+        self.checkpoint = checkpoint
+        self.checkpointEvery = checkpointEvery
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.cards = {}     # card idShort -> [list, closed]
+        self.counts = {}    # list -> open card count for current day
+        self.daily = {}     # day -> closing counts
+        self.day = arrow.utcnow().format('YYYY-MM-DD')
+        self.events = 0
+        self.rejected = 0
+        self.lastDate = None
+        self.recent = collections.deque()
+        self.recentIds = set([])
+        self.sinceCheckpoint = 0
+
+    def seed(self,cards,boardLists):
+        '''
+        Receives: cards with idShort,idList,closed fields and board lists
+        '''
+        names = {ls.get('id'):ls.get('name') for ls in boardLists}
+        with self.lock:
+            self.cards = {}
+            self.counts = {}
+            for card in cards:
+                name = names.get(card.get('idList'))
+                if name:
+                    self.setCard(card.get('idShort'),name,bool(card.get('closed')))
+        print("Seeded {} cards across {} lists".format(len(self.cards),len(self.counts)))
+
+    def setCard(self,card,listName,closed):
+        prev = self.cards.get(card)
+        if prev and not prev[1]:
+            self.counts[prev[0]] -= 1
+        self.cards[card] = [listName,closed]
+        if not closed:
+            self.counts[listName] = self.counts.get(listName,0) + 1
+
+    def removeCard(self,card):
+        prev = self.cards.pop(card,None)
+        if prev and not prev[1]:
+            self.counts[prev[0]] -= 1
+
+    def rollDay(self):
+        today = arrow.utcnow().format('YYYY-MM-DD')
+        if today != self.day:
+            self.daily[self.day] = dict(self.counts)
+            self.day = today
+
+    def isDuplicate(self,actionId):
+        if actionId in self.recentIds:
+            return True
+        self.recent.append(actionId)
+        self.recentIds.add(actionId)
+        if len(self.recent) > RECENT_ACTIONS:
+            self.recentIds.discard(self.recent.popleft())
+        return False
+
+    def applyAction(self,action):
+        '''
+        Receives: raw Trello action as delivered in a webhook payload
+        Returns: True if the action changed card state
+        '''
+        if self.isDuplicate(action.get('id')):
+            return False
+        d = createActionDict(action)
+        self.events += 1
+        self.sinceCheckpoint += 1
+        self.lastDate = max(self.lastDate or d.get('date'),d.get('date'))
+        card = d.get('card')
+        if card is None:
+            return False
+        if d.get('category') in REMOVE_CATEGORIES:
+            self.removeCard(card)
+        elif d.get('category') in CARD_STATE_CATEGORIES and d.get('after'):
+            self.setCard(card,d.get('after'),bool(d.get('closed')))
+        else:
+            return False
+        return True
+
+    def applyActions(self,actions):
+        '''
+        Receives: raw Trello actions in oldest first order
+        '''
+        with self.lock:
+            self.rollDay()
+            for action in actions:
+                try:
+                    self.applyAction(action)
+                except Exception as e:
+                    self.rejected += 1
+                    self.verbose and print("Rejected action {}: '{}'".format(action.get('id'),e))
+
+    def getCounts(self):
+        with self.lock:
+            self.rollDay()
+            return {'date':self.day,'counts':dict(self.counts),'daily':dict(self.daily),
+                    'events':self.events,'rejected':self.rejected,'backlog':self.queue.qsize()}
+
+    def saveCheckpoint(self):
+        with self.lock:
+            state = {'day':self.day,'counts':self.counts,'daily':self.daily,'events':self.events,
+                     'lastDate':self.lastDate,'recent':list(self.recent)[-1000:],'cards':[[k,v[0],v[1]] for k,v in self.cards.items()]}
+            self.sinceCheckpoint = 0
+        tmp = '{}.tmp'.format(self.checkpoint)
+        with open(tmp,'w') as f:
+            json.dump(state,f)
+        os.replace(tmp,self.checkpoint)
+        self.verbose and print("Checkpointed {} cards after {} events".format(len(state['cards']),state['events']))
+
+    def loadCheckpoint(self):
+        '''
+        Returns: True if state was restored from the checkpoint file
+        '''
+        if not os.path.exists(self.checkpoint):
+            return False
+        with open(self.checkpoint,'r') as f:
+            state = json.load(f)
+        with self.lock:
+            self.day = state.get('day')
+            self.counts = state.get('counts')
+            self.daily = state.get('daily')
+            self.events = state.get('events')
+            self.lastDate = state.get('lastDate')
+            self.cards = {card:[name,closed] for card,name,closed in state.get('cards')}
+            self.recent = collections.deque(state.get('recent',[]))
+            self.recentIds = set(self.recent)
+            self.rollDay()
+        print("Restored {} cards from '{}' last action at {}".format(len(self.cards),self.checkpoint,self.lastDate))
+        return True
+
+    def applyQueued(self):
+        '''
+        Drains the queue applying actions under a single lock acquisition per batch.
+        '''
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                self.applyActions(batch)
+                break
+            self.applyActions(batch)
+            if self.sinceCheckpoint >= self.checkpointEvery:
+                self.saveCheckpoint()
+        self.saveCheckpoint()
+
+    def serve(self,port,host='',onReady=None):
+        '''
+        Receives: port to listen on, optional callable run once the server is listening
+        such as webhook registration which needs the HEAD validation to succeed
+        '''
+        applier = threading.Thread(target=self.applyQueued,daemon=True)
+        applier.start()
+        server = ThreadingHTTPServer((host,port),makeWebhookHandler(self))
+        server.daemon_threads = True
+        print("Watching for Trello webhooks on port {}".format(port))
+        if onReady:
+            threading.Thread(target=onReady,daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.queue.put(None)
+            applier.join()
+
+def makeWebhookHandler(watcher):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def reply(self,status,body=b''):
+            self.send_response(status)
+            self.send_header('Content-Type','application/json')
+            self.send_header('Content-Length',str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_HEAD(self):
+            # Trello validates the callback URL with a HEAD request
+            self.reply(200)
+
+        def do_GET(self):
+            self.reply(200,json.dumps(watcher.getCounts()).encode('utf-8'))
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length',0))
+            try:
+                payload = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError:
+                self.reply(400)
+                return
+            # Accept a single webhook payload or a list of them
+            payloads = payload if isinstance(payload,list) else [payload]
+            for p in payloads:
+                action = p.get('action')
+                if action:
+                    watcher.queue.put(action)
+            self.reply(200)
+
+        def log_message(self,format,*args):
+            watcher.verbose and BaseHTTPRequestHandler.log_message(self,format,*args)
+    return WebhookHandler
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# webhookReplay.py
+# ----------------
+# Script to replay Trello webhook payloads against a local trelloReporter watch endpoint.
+#
+# Mal Minhas <mal@kano.me>
+# Copyright (c) 2018 Kano Computing. All Rights Reserved.
+# Licence: GPLv3
+#
+
+import sys
+import json
+import time
+import random
+import threading
+import http.client
+import urllib.parse
+import arrow
+
+PROGRAM             = __file__
+VERSION             = '0.1'
+
+def loadPayloads(path):
+    '''
+    Receives: file of JSON lines each holding a webhook payload or a raw action
+    Returns: list of webhook payloads
+    '''
+    payloads = []
+    with open(path,'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                p = json.loads(line)
+                payloads.append(p if 'action' in p else {'action':p})
+    return payloads
+
+def createSyntheticPayloads(count,lists,cards=1000):
+    '''
+    Returns: list of webhook payloads moving random cards between lists
+    '''
+    board = {'id':'b'*24,'name':'Synthetic'}
+    member = {'fullName':'Replay'}
+    now = arrow.utcnow()
+    payloads = []
+    for i in range(count):
+        before,after = random.sample(lists,2)
+        card = random.randrange(cards)
+        action = {'id':'{:024x}'.format(i),'type':'updateCard','date':now.shift(seconds=i).format('YYYY-MM-DDTHH:mm:ss.SSS')+'Z',
+                  'memberCreator':member,
+                  'data':{'board':board,'card':{'id':'{:024x}'.format(card),'idShort':card,'name':'Card {}'.format(card)},
+                          'listBefore':{'name':before},'listAfter':{'name':after}}}
+        payloads.append({'action':action})
+    return payloads
+
+def replay(url,payloads,batch,threads):
+    '''
+    Posts payloads to url over persistent connections from several threads.
+    Returns: elapsed seconds
+    '''
+    parts = urllib.parse.urlparse(url)
+    batches = [payloads[i:i+batch] for i in range(0,len(payloads),batch)]
+    def worker(mine):
+        conn = http.client.HTTPConnection(parts.hostname,parts.port or 80)
+        for b in mine:
+            body = json.dumps(b if batch > 1 else b[0]).encode('utf-8')
+            conn.request('POST',parts.path or '/',body=body,headers={'Content-Type':'application/json'})
+            r = conn.getresponse()
+            r.read()
+            assert(r.status == 200)
+        conn.close()
+    t0 = time.time()
+    workers = [threading.Thread(target=worker,args=(batches[i::threads],)) for i in range(threads)]
+    [w.start() for w in workers]
+    [w.join() for w in workers]
+    return time.time() - t0
+
+def getCounts(url):
+    parts = urllib.parse.urlparse(url)
+    conn = http.client.HTTPConnection(parts.hostname,parts.port or 80)
+    conn.request('GET',parts.path or '/')
+    counts = json.loads(conn.getresponse().read().decode('utf-8'))
+    conn.close()
+    return counts
+
+def main():
+    import docopt
+    usage="""
+
+        %s
+        --------------
+        Usage:
+        %s replay <payloads> [--url=<url>] [--batch=<n>] [--threads=<n>] [-v]
+        %s synthetic <count> [--url=<url>] [--batch=<n>] [--threads=<n>] [--l=<lists>] [-v]
+        %s -h | --help
+        %s -V | --version
+
+        Options:
+        -h --help               Show this screen.
+        -v --verbose            Verbose mode.
+        -V --version            Show version.
+        --url=<url>             Watch endpoint [default: http://localhost:8080/]
+        --batch=<n>             Payloads per POST [default: 1]
+        --threads=<n>           Concurrent connections [default: 4]
+        --l=<lists>             Lists used for synthetic moves [default: P1,P2,P3,Done]
+
+        Examples:
+        1. Replay captured webhook payloads one per request:
+        %s replay payloads.jsonl
+        2. Send a burst of 10000 synthetic card moves in batches of 100:
+        %s synthetic 10000 --batch=100
+        """ % tuple([PROGRAM] * 7)
+
+    arguments = docopt.docopt(usage)
+    verbose = arguments.get('--verbose') or arguments.get('-v')
+    if arguments.get('--version') or arguments.get('-V'):
+        print("%s version %s" % (PROGRAM,VERSION))
+        return
+    url = arguments.get('--url')
+    if arguments.get('replay'):
+        payloads = loadPayloads(arguments.get('<payloads>'))
+    else:
+        payloads = createSyntheticPayloads(int(arguments.get('<count>')),arguments.get('--l').split(','))
+    elapsed = replay(url,payloads,int(arguments.get('--batch')),int(arguments.get('--threads')))
+    print("Sent {} payloads in {:.2f}s ({:.0f}/s)".format(len(payloads),elapsed,len(payloads)/max(elapsed,1e-6)))
+    counts = getCounts(url)
+    verbose and print(json.dumps(counts,indent=2))
+    print("Watcher applied {} events, backlog {}".format(counts.get('events'),counts.get('backlog')))
+
+if __name__ == "__main__":
+    main()
+    sys.exit(0)